@@ -0,0 +1,114 @@
+"""
+persistent API response cache shared by all processes
+"""
+
+import json
+import os
+import threading
+import time
+import zlib
+from collections import Counter
+
+import metrics
+from storage import LruTable, connect
+
+CACHE_DB = "api_cache.sqlite"
+MAX_BYTES = int(os.environ.get("API_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Seconds an entry is served without going back to the API
+TTL_TIERS = {
+    "long": int(os.environ.get("API_CACHE_TTL_LONG", 24 * 60 * 60)),  # playlist metadata, track metadata
+    "medium": int(os.environ.get("API_CACHE_TTL_MEDIUM", 12 * 60 * 60)),  # playlist track pages
+    "short": int(os.environ.get("API_CACHE_TTL_SHORT", os.environ.get("PLAYCOUNT_MAX_AGE", 6 * 60 * 60))),  # playcounts
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    tier TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+"""
+
+
+def cache_key(url, params=None, extra=None):
+    # Never includes headers, so a token refresh does not invalidate anything
+    key = url
+    if params:
+        key += "?" + "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+    if extra:
+        key += f"#{extra}"
+    return key
+
+
+class ApiCache:
+    def __init__(self, filename=CACHE_DB, max_bytes=MAX_BYTES):
+        self._lock = threading.Lock()
+        self._conn = connect(filename)
+        self._conn.executescript(SCHEMA)
+        # Expired entries go first, then least recently used
+        self._table = LruTable(self._conn, "responses", ["key"], max_bytes, expire=self._delete_expired)
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def _delete_expired(self):
+        now = time.time()
+        for tier, ttl in TTL_TIERS.items():
+            self._conn.execute("DELETE FROM responses WHERE tier = ? AND stored_at < ?", (tier, now - ttl))
+
+    def get(self, key, tier):
+        return self.get_many([key], tier).get(key)
+
+    def get_many(self, keys, tier):
+        # {key: value} for the fresh entries among `keys`
+        keys = list(keys)
+        now = time.time()
+        with self._lock:
+            rows = self._table.get_many("value", keys, "stored_at >= ?", [now - TTL_TIERS[tier]], now)
+            found = {key: json.loads(zlib.decompress(value)) for key, value in rows}
+            self.hits[tier] += len(found)
+            self.misses[tier] += len(keys) - len(found)
+        metrics.inc("cache_lookups_total", len(found), tier=tier, result="hit")
+        metrics.inc("cache_lookups_total", len(keys) - len(found), tier=tier, result="miss")
+        return found
+
+    def set(self, key, value, tier):
+        self.set_many({key: value}, tier)
+
+    def set_many(self, values, tier):
+        now = time.time()
+        rows = []
+        for key, value in values.items():
+            blob = zlib.compress(json.dumps(value).encode("utf-8"))
+            rows.append((key, tier, blob, len(blob), now, now))
+        with self._lock:
+            self._table.replace(["key", "tier", "value", "size", "stored_at", "accessed_at"], rows)
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            tiers = {}
+            for tier in TTL_TIERS:
+                lookups = self.hits[tier] + self.misses[tier]
+                tiers[tier] = {
+                    "hits": self.hits[tier],
+                    "misses": self.misses[tier],
+                    "hit_ratio": self.hits[tier] / lookups if lookups else None,
+                }
+            return {"entries": entries, "bytes": self._table.size, "max_bytes": self._table.max_bytes, "tiers": tiers}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_api_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ApiCache()
+        return _cache
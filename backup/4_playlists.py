@@ -2,21 +2,9 @@ import streamlit as st
 import json
 import requests
 import asyncio
-import shutil
-import subprocess
-from playwright.async_api import async_playwright
 from pathlib import Path
 
-def ensure_playwright_installed():
-    if not shutil.which("playwright"):
-        st.error("Playwright ist nicht installiert.")
-        return
-    try:
-        subprocess.run(["playwright", "install", "chromium"], check=True)
-    except Exception as e:
-        st.error(f"Fehler bei playwright install: {e}")
-
-ensure_playwright_installed()
+from provisioning import ensure_browser
 
 # Use an absolute path relative to this file for the playlists file
 PLAYLISTS_FILE = Path(__file__).parent.parent / "data" / "playlists.json"
@@ -90,6 +78,12 @@ def is_token_valid(token):
         return False
 
 async def get_new_token():
+    ok, error = ensure_browser()
+    if not ok:
+        st.error(f"Fehler bei playwright install: {error}")
+        return None
+    from playwright.async_api import async_playwright
+
     token = None
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
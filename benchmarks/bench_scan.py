@@ -0,0 +1,177 @@
+"""
+end-to-end scan benchmark against the local stand-ins in stub_api.py
+
+    python benchmarks/bench_scan.py                       # 40, 400 and 4000 playlists
+    python benchmarks/bench_scan.py --sizes 400 --rate-limit-ratio 0.02 --latency-ms 50
+    python benchmarks/bench_scan.py --no-pdf --json bench.json
+
+Every size runs in a fresh worker process with its own empty cache directory and goes
+through three scan phases: cold (empty index and caches), revalidate (every playlist
+checked with If-None-Match / checksum) and warm (answered from the index). Each phase
+reports p50/p99 scan time, p50/p99 time-to-playlist, requests and bytes per host, 429s
+and the worker's peak RSS. The PDF of the cold scan's results is rendered once per size.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, fields
+from urllib.request import urlopen
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from stub_api import QUERY_ARTIST, StubApis, StubConfig  # noqa: E402
+
+DEFAULT_SIZES = [40, 400, 4000]
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(share * (len(values) - 1))))]
+
+
+def stub_call(base, path):
+    with urlopen(f"{base}{path}") as response:
+        body = response.read()
+    return json.loads(body) if body else None
+
+
+# --- worker (one process per playlist count) ---
+
+def run_phase(playlists, stub_base):
+    import resource
+
+    from scan_engine import ScanStream, collect_results
+
+    stub_call(stub_base, "/__reset")
+    started = time.perf_counter()
+    done_at = []
+    playlist_results = [None] * len(playlists)
+    for number, result in ScanStream(playlists, [QUERY_ARTIST], "bench-token"):
+        playlist_results[number] = result
+        done_at.append(time.perf_counter() - started)
+    scan = collect_results(playlist_results, QUERY_ARTIST)
+    scan_seconds = time.perf_counter() - started
+    # All stand-ins share one set of counters, any of them reports it
+    stats = stub_call(stub_base, "/__stats")
+    return scan["results"], {
+        "scan_s": scan_seconds,
+        "playlist_p50_s": percentile(done_at, 0.5),
+        "playlist_p99_s": percentile(done_at, 0.99),
+        "listings": scan["total_listings"],
+        "tracks": len(scan["results"]),
+        "requests": stats["requests"],
+        "bytes": stats["bytes"],
+        "throttled": stats["throttled"],
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def worker(args):
+    import http_client
+    import rate_limit
+    import scan_engine
+
+    urls = json.loads(os.environ["BENCH_STUB_URLS"])
+    real_hosts = {"spotify": "api.spotify.com", "partner": "api-partner.spotify.com",
+                  "deezer": "api.deezer.com", "cdn": None}
+    for service, base in urls.items():
+        host = http_client.host_of(base)
+        real = real_hosts[service]
+        if args.real_limits and real:
+            rate_limit.RATE_LIMITS[host] = rate_limit.RATE_LIMITS[real]
+        else:
+            rate_limit.RATE_LIMITS[host] = (100000, 100000)
+        http_client.POOL_SIZES[host] = http_client.POOL_SIZES.get(real, http_client.DEFAULT_POOL_SIZE)
+
+    playlists = [(f"dz{n}", "deezer") if n % 4 == 0 else (f"sp{n}", "spotify") for n in range(args.size)]
+    results = {}
+    tracks, cold = run_phase(playlists, urls["spotify"])
+    results["cold"] = [cold]
+    scan_engine.SCAN_REVALIDATE_INTERVAL = 0
+    results["revalidate"] = [run_phase(playlists, urls["spotify"])[1] for _ in range(args.repeat)]
+    scan_engine.SCAN_REVALIDATE_INTERVAL = 10 ** 9
+    results["warm"] = [run_phase(playlists, urls["spotify"])[1] for _ in range(args.repeat)]
+    if not args.no_pdf and tracks:
+        from pdf_report import generate_pdf
+
+        stub_call(urls["spotify"], "/__reset")
+        with tempfile.TemporaryDirectory() as output_dir:
+            started = time.perf_counter()
+            generate_pdf(tracks, QUERY_ARTIST, os.path.join(output_dir, "bench.pdf"))
+            results["pdf"] = {"pdf_s": time.perf_counter() - started, "tracks": len(tracks),
+                              "requests": stub_call(urls["spotify"], "/__stats")["requests"]}
+    print(json.dumps(results))
+
+
+# --- driver ---
+
+def summarize(size, phases):
+    lines = []
+    pdf = phases.pop("pdf", None)
+    for phase, runs in phases.items():
+        scan_times = [run["scan_s"] for run in runs]
+        last = runs[-1]
+        requests = sum(last["requests"].values())
+        lines.append(
+            f"{size:>6} {phase:<10} scan p50 {percentile(scan_times, 0.5):7.2f}s p99 {percentile(scan_times, 0.99):7.2f}s"
+            f" | playlist p50 {last['playlist_p50_s']:6.2f}s p99 {last['playlist_p99_s']:6.2f}s"
+            f" | {requests:>6} req ({', '.join(f'{k} {v}' for k, v in sorted(last['requests'].items()))})"
+            f" {sum(last['bytes'].values()) / 1e6:7.1f} MB, {sum(last['throttled'].values())} x 429"
+            f" | peak {last['peak_rss_mb']:.0f} MB"
+        )
+    if pdf:
+        lines.append(f"{size:>6} {'pdf':<10} {pdf['pdf_s']:7.2f}s for {pdf['tracks']} tracks,"
+                     f" {sum(pdf['requests'].values())} image requests")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=lambda value: [int(n) for n in value.split(",")], default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=5, help="runs of the revalidate and warm phases")
+    parser.add_argument("--no-pdf", action="store_true", help="stop after the scan, skip PDF rendering")
+    parser.add_argument("--real-limits", action="store_true",
+                        help="apply the production per-host rate limits to the stand-ins")
+    parser.add_argument("--json", metavar="FILE", help="also write the raw measurements here")
+    parser.add_argument("--worker", type=int, dest="size", help=argparse.SUPPRESS)
+    for field in fields(StubConfig):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(field.default), default=field.default)
+    args = parser.parse_args()
+
+    if args.size is not None:
+        return worker(args)
+
+    config = StubConfig(**{field.name: getattr(args, field.name) for field in fields(StubConfig)})
+    stubs = StubApis(config).start()
+    report = {"config": asdict(config), "sizes": {}}
+    try:
+        for size in args.sizes:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                env = dict(os.environ, **stubs.environ(), PLAYLIST_SCANNER_CACHE_DIR=cache_dir,
+                           BENCH_STUB_URLS=json.dumps(stubs.urls))
+                command = [sys.executable, os.path.abspath(__file__), "--worker", str(size),
+                           "--repeat", str(args.repeat)]
+                command += ["--no-pdf"] if args.no_pdf else []
+                command += ["--real-limits"] if args.real_limits else []
+                output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+            phases = json.loads(output.strip().splitlines()[-1])
+            report["sizes"][size] = dict(phases)
+            print("\n".join(summarize(size, phases)), flush=True)
+    finally:
+        stubs.stop()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+local stand-ins for the Spotify Web API, the pathfinder endpoint, the Deezer API and an image CDN
+
+Each service listens on its own loopback address (127.0.0.2-5) so the per-host pools and
+rate limiters see four hosts, just like in production. Playlist contents are derived from
+the playlist number, so every run over the same settings sees the same data.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+SERVICES = {
+    "spotify": "127.0.0.2",
+    "partner": "127.0.0.3",
+    "deezer": "127.0.0.4",
+    "cdn": "127.0.0.5",
+}
+
+ARTISTS = [f"Artist {n}" for n in range(500)]
+QUERY_ARTIST = "Capelli"  # placed on roughly `hit_ratio` of all tracks
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 20.0
+    jitter_ms: float = 10.0
+    tracks_per_playlist: int = 120
+    catalog_size: int = 20000
+    tracks_per_album: int = 12
+    hit_ratio: float = 0.01
+    rate_limit_ratio: float = 0.0  # share of requests answered with 429
+    retry_after: float = 0.5
+    description_bytes: int = 200
+    image_px: int = 300
+    seed: int = 1
+
+
+class StubState:
+    def __init__(self, config):
+        self.config = config
+        self.requests = Counter()
+        self.bytes_sent = Counter()
+        self.throttled = Counter()
+        self._lock = threading.Lock()
+        self._random = random.Random(config.seed)
+        self.image = self._make_image(config.image_px)
+
+    @staticmethod
+    def _make_image(px):
+        try:
+            from PIL import Image
+        except ImportError:
+            return b"\xff\xd8\xff\xd9"
+        buffer = BytesIO()
+        Image.new("RGB", (px, px), (29, 185, 84)).save(buffer, format="JPEG", quality=85)
+        return buffer.getvalue()
+
+    def count(self, service, size, throttled=False):
+        with self._lock:
+            self.requests[service] += 1
+            self.bytes_sent[service] += size
+            if throttled:
+                self.throttled[service] += 1
+
+    def roll(self):
+        with self._lock:
+            return self._random.random()
+
+    def stats(self):
+        with self._lock:
+            return {"requests": dict(self.requests), "bytes": dict(self.bytes_sent),
+                    "throttled": dict(self.throttled)}
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.bytes_sent.clear()
+            self.throttled.clear()
+
+    # --- synthetic catalog ---
+    def track_number(self, playlist, position):
+        return (playlist * 7919 + position * 31) % self.config.catalog_size
+
+    def artist(self, track_number):
+        # Deterministic, roughly hit_ratio of tracks belong to QUERY_ARTIST
+        if (track_number * 2654435761) % 10000 < self.config.hit_ratio * 10000:
+            return QUERY_ARTIST
+        return ARTISTS[track_number % len(ARTISTS)]
+
+    def spotify_track(self, track_number, cdn):
+        album = track_number // self.config.tracks_per_album
+        return {
+            "id": f"t{track_number}",
+            "name": f"Song {track_number}",
+            "artists": [{"name": self.artist(track_number), "id": f"a{track_number % len(ARTISTS)}"}],
+            "album": {"id": f"al{album}", "release_date": f"20{10 + album % 15}-01-01",
+                      "images": [{"url": f"{cdn}/img/al{album}.jpg"}]},
+            "popularity": track_number % 100,
+        }
+
+    def deezer_track(self, track_number, cdn):
+        return {
+            "id": track_number,
+            "title": f"Song {track_number}",
+            "artist": {"id": track_number % len(ARTISTS), "name": self.artist(track_number)},
+            "album": {"cover": f"{cdn}/img/dz{track_number}.jpg"},
+            "rank": track_number * 13,
+        }
+
+
+def make_handler(service, state, urls):
+    config = state.config
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, status, body=b"", content_type="application/json", headers=None, counted=True):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+            if counted:
+                state.count(service, len(body), throttled=status == 429)
+
+        def send_json(self, data, headers=None):
+            self.send(200, json.dumps(data).encode("utf-8"), headers=headers)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            if url.path == "/__stats":
+                return self.send(200, json.dumps(state.stats()).encode("utf-8"), counted=False)
+            if url.path == "/__reset":
+                state.reset()
+                return self.send(204, counted=False)
+            time.sleep(max(0.0, config.latency_ms + state.roll() * config.jitter_ms) / 1000)
+            if config.rate_limit_ratio and state.roll() < config.rate_limit_ratio:
+                return self.send(429, b"{}", headers={"Retry-After": str(config.retry_after)})
+            getattr(self, f"get_{service}")(url.path.strip("/").split("/"), params)
+
+        def get_spotify(self, path, params):
+            cdn = urls["cdn"]
+            if path[:2] == ["v1", "playlists"]:
+                playlist = int(path[2].lstrip("sp"))
+                if len(path) == 4:
+                    offset, limit = int(params.get("offset", 0)), int(params.get("limit", 100))
+                    total = config.tracks_per_playlist
+                    items = [{"track": state.spotify_track(state.track_number(playlist, position), cdn)}
+                             for position in range(offset, min(offset + limit, total))]
+                    return self.send_json({"items": items, "total": total, "offset": offset, "limit": limit})
+                etag = f'"sp{playlist}-v1"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self.send(304)
+                data = {"snapshot_id": f"sp{playlist}-v1"}
+                if params.get("fields") != "snapshot_id":
+                    data.update({
+                        "name": f"Playlist {playlist}",
+                        "description": "x" * config.description_bytes,
+                        "owner": {"display_name": f"Curator {playlist % 37}"},
+                        "followers": {"total": playlist * 101},
+                        "images": [{"url": f"{cdn}/img/sp{playlist}.jpg"}],
+                    })
+                return self.send_json(data, headers={"ETag": etag})
+            if path == ["v1", "tracks"]:
+                return self.send_json({"tracks": [state.spotify_track(int(track_id.lstrip("t")), cdn)
+                                                  for track_id in params.get("ids", "").split(",") if track_id]})
+            if path == ["v1", "search"]:
+                return self.send_json({"tracks": {"items": [state.spotify_track(0, cdn)]}})
+            self.send(404, b"{}")
+
+        def get_partner(self, path, params):
+            variables = json.loads(params.get("variables", "{}"))
+            uri = variables.get("uri", "")
+            if params.get("operationName") == "getAlbum":
+                album = int(uri.split(":")[-1].lstrip("al"))
+                first = album * config.tracks_per_album
+                items = [{"track": {"uri": f"spotify:track:t{n}", "playcount": str(n * 1000)}}
+                         for n in range(first, first + config.tracks_per_album)]
+                return self.send_json({"data": {"albumUnion": {"tracksV2": {
+                    "totalCount": len(items), "items": items[variables.get("offset", 0):]}}}})
+            track_number = int(uri.split(":")[-1].lstrip("t") or 0)
+            return self.send_json({"data": {"trackUnion": {"playcount": str(track_number * 1000)}}})
+
+        def get_deezer(self, path, params):
+            cdn = urls["cdn"]
+            if path[0] != "playlist":
+                return self.send(404, b"{}")
+            playlist = int(path[1].lstrip("dz"))
+            total = config.tracks_per_playlist
+            if len(path) == 3:
+                index, limit = int(params.get("index", 0)), int(params.get("limit", 25))
+                data = [state.deezer_track(state.track_number(playlist, position), cdn)
+                        for position in range(index, min(index + limit, total))]
+                return self.send_json({"data": data, "total": total})
+            embedded = [state.deezer_track(state.track_number(playlist, position), cdn)
+                        for position in range(min(25, total))]
+            return self.send_json({
+                "title": f"Deezer Playlist {playlist}",
+                "description": "x" * config.description_bytes,
+                "fans": playlist * 11,
+                "checksum": f"dz{playlist}-v1",
+                "nb_tracks": total,
+                "creator": {"name": f"Curator {playlist % 37}"},
+                "picture": f"{cdn}/img/dz{playlist}.jpg",
+                "tracks": {"data": embedded},
+            })
+
+        def get_cdn(self, path, params):
+            self.send(200, state.image, content_type="image/jpeg")
+
+    return Handler
+
+
+class StubApis:
+    """Start all four stand-ins in background threads; `urls` maps service name to base URL."""
+
+    def __init__(self, config=None):
+        self.state = StubState(config or StubConfig())
+        self.urls = {}
+        self._servers = []
+        for service, address in SERVICES.items():
+            server = ThreadingHTTPServer((address, 0), make_handler(service, self.state, self.urls))
+            server.daemon_threads = True
+            self.urls[service] = f"http://{address}:{server.server_address[1]}"
+            self._servers.append(server)
+
+    def start(self):
+        for server in self._servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+
+    def environ(self):
+        # Settings that point the scan engine and the PDF renderer at the stand-ins
+        return {
+            "SPOTIFY_API_BASE": self.urls["spotify"],
+            "SPOTIFY_PARTNER_API_BASE": self.urls["partner"],
+            "DEEZER_API_BASE": self.urls["deezer"],
+            "PDF_BACKGROUND_URL": f"{self.urls['cdn']}/img/background.jpg",
+        }
@@ -0,0 +1,154 @@
+"""
+headless playlist scanner
+
+    python cli.py capelli "other artist" --format csv --output placements.csv
+    python cli.py --queries roster.txt --format pdf --output reports/
+
+Exit codes: 0 at least one query was found, 1 nothing was found,
+2 bad arguments or configuration, 3 scan failed (API, network, token),
+4 the results could not be written.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+import metrics
+from crawler import PLAYLISTS_FILE, load_api_token, load_playlists, load_token
+from scan_engine import SCAN_CONCURRENCY, ScanStream, collect_results
+
+EXIT_FOUND = 0
+EXIT_NOT_FOUND = 1
+EXIT_USAGE = 2
+EXIT_SCAN_FAILED = 3
+EXIT_OUTPUT_FAILED = 4
+
+CSV_FIELDS = ["query", "track", "artists", "track_id", "platform", "playlist", "position",
+              "followers", "owner", "playlist_url", "streams", "release_date"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scan the tracked playlists without the Streamlit app.")
+    parser.add_argument("query", nargs="*", help="artist or song to look for")
+    parser.add_argument("--queries", metavar="FILE", help="file with one artist or song per line")
+    parser.add_argument("--format", choices=["json", "csv", "pdf"], default="json")
+    parser.add_argument("--output", "-o", help="output file (json/csv, default stdout) or directory (pdf, default .)")
+    parser.add_argument("--playlists", default=PLAYLISTS_FILE, help="playlists.json to scan")
+    parser.add_argument("--token", help="Spotify web-player token (default: SPOTIFY_TOKEN or token.txt); "
+                                        "the Web API uses SPOTIFY_CLIENT_ID/SPOTIFY_CLIENT_SECRET when set")
+    parser.add_argument("--concurrency", type=int, help="max in-flight requests")
+    parser.add_argument("--metrics", metavar="FILE", help="write request and phase metrics as JSON here")
+    return parser.parse_args(argv)
+
+
+def read_queries(args):
+    queries = [query.strip() for query in args.query]
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries.extend(line.strip() for line in f)
+    return list(dict.fromkeys(query for query in queries if query))
+
+
+def csv_rows(scans):
+    for query, scan in scans.items():
+        for res in scan["results"].values():
+            track = res["track"]
+            for plist in res["playlists"]:
+                yield {
+                    "query": query,
+                    "track": track.get("name", ""),
+                    "artists": ", ".join(a.get("name", "") for a in track.get("artists", [])),
+                    "track_id": track.get("id", ""),
+                    "platform": plist["platform"],
+                    "playlist": plist["name"],
+                    "position": plist["position"],
+                    "followers": plist["followers"],
+                    "owner": plist["owner"],
+                    "playlist_url": plist["url"],
+                    "streams": track.get("streams", ""),
+                    "release_date": track.get("release_date", ""),
+                }
+
+
+def json_scans(scans):
+    # The match keys stored with every track are an index detail, not part of the output
+    return {
+        query: {**scan, "results": {
+            key: {**res, "track": {k: v for k, v in res["track"].items() if k != "keys"}}
+            for key, res in scan["results"].items()
+        }}
+        for query, scan in scans.items()
+    }
+
+
+def write_output(scans, fmt, output):
+    if fmt == "pdf":
+        from pdf_report import generate_pdf, pdf_filename
+
+        directory = output or "."
+        os.makedirs(directory, exist_ok=True)
+        for query, scan in scans.items():
+            if scan["results"]:
+                path = generate_pdf(scan["results"], query, os.path.join(directory, pdf_filename(query)))
+                print(path, file=sys.stderr)
+        return
+    out = open(output, "w", encoding="utf-8", newline="") if output else sys.stdout
+    try:
+        if fmt == "json":
+            json.dump(json_scans(scans), out, ensure_ascii=False, indent=2)
+            out.write("\n")
+        else:
+            writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(csv_rows(scans))
+    finally:
+        if output:
+            out.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        queries = read_queries(args)
+        playlists = load_playlists(args.playlists)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    if not queries:
+        print("error: no queries given", file=sys.stderr)
+        return EXIT_USAGE
+    api_token = load_api_token()
+    token = args.token or load_token()
+    if not token and not api_token:
+        print("error: no Spotify token (use --token, SPOTIFY_TOKEN, token.txt or SPOTIFY_CLIENT_ID/SECRET)",
+              file=sys.stderr)
+        return EXIT_USAGE
+    stream = ScanStream(playlists, queries, token, args.concurrency or SCAN_CONCURRENCY, api_token)
+    try:
+        playlist_results = [result for _, result in sorted(stream, key=lambda item: item[0])]
+    except Exception as e:
+        print(f"error: scan failed: {e}", file=sys.stderr)
+        return EXIT_SCAN_FAILED
+    if stream.failed:
+        print(f"warning: {len(stream.failed)}/{len(playlists)} playlists could not be refreshed", file=sys.stderr)
+    if playlists and not any(playlist_results):
+        # Nothing fetched and nothing indexed from an earlier run: "not found" would be a lie
+        print("error: scan failed: no playlist could be fetched", file=sys.stderr)
+        return EXIT_SCAN_FAILED
+    scans = {query: collect_results(playlist_results, query) for query in queries}
+    try:
+        write_output(scans, args.format, args.output)
+    except Exception as e:
+        print(f"error: could not write output: {e}", file=sys.stderr)
+        return EXIT_OUTPUT_FAILED
+    if args.metrics:
+        metrics.write_json(args.metrics)
+    found = [query for query, scan in scans.items() if scan["results"]]
+    print(f"{len(found)}/{len(queries)} queries found in {len(playlists)} playlists", file=sys.stderr)
+    return EXIT_FOUND if found else EXIT_NOT_FOUND
+
+
+if __name__ == "__main__":
+    sys.exit(main())
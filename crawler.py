@@ -0,0 +1,162 @@
+"""
+scheduled prefetch of all tracked playlists into the local index and caches
+
+Standalone:  python crawler.py [--once]
+In-process:  crawler.start_background_crawler()
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from playlist_index import get_index
+from scan_engine import REVALIDATE_INTERVAL, SCAN_CONCURRENCY, ScanEngine, get_loop
+from token_manager import get_api_token_manager, get_web_token_manager
+
+PLAYLISTS_FILE = ".secrets/playlists.json"
+
+# (start weekday, hour), (end weekday, hour), seconds between crawls; weekday 0 is Monday.
+# Releases land on Friday 00:00, so crawl every 30 minutes from Thursday 23:00 to Friday noon.
+SCHEDULE = [
+    ((3, 23), (4, 12), int(os.environ.get("CRAWLER_RELEASE_INTERVAL", 30 * 60))),
+]
+DEFAULT_INTERVAL = int(os.environ.get("CRAWLER_INTERVAL", 60 * 60))
+
+
+def _week_minute(weekday, hour, minute=0):
+    return (weekday * 24 + hour) * 60 + minute
+
+
+def interval_at(moment):
+    """Seconds between crawls at local time `moment` according to SCHEDULE."""
+    now = _week_minute(moment.weekday(), moment.hour, moment.minute)
+    for start, end, interval in SCHEDULE:
+        start, end = _week_minute(*start), _week_minute(*end)
+        inside = start <= now < end if start <= end else (now >= start or now < end)
+        if inside:
+            return interval
+    return DEFAULT_INTERVAL
+
+
+def next_run(last_run):
+    # A fast window that opens before the slow interval is up starts the crawl early
+    interval = interval_at(last_run)
+    moment = last_run + timedelta(seconds=interval)
+    probe = last_run + timedelta(minutes=1)
+    while probe < moment:
+        if interval_at(probe) < interval:
+            return probe
+        probe += timedelta(minutes=1)
+    return moment
+
+
+def load_playlists(path=PLAYLISTS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [(pid, "spotify") for pid in data.get("spotify", {})] + [(pid, "deezer") for pid in data.get("deezer", {})]
+
+
+def load_token():
+    # Shares the app's token (and its refresh) through token.txt; SPOTIFY_TOKEN overrides it for standalone runs
+    token = os.environ.get("SPOTIFY_TOKEN")
+    if token:
+        return token
+    return get_web_token_manager().get()
+
+
+def load_api_token():
+    # Client-credentials token for the public Web API, if SPOTIFY_CLIENT_ID/SECRET (or the app's secrets) are set
+    manager = get_api_token_manager()
+    return manager.get() if manager else None
+
+
+async def crawl(playlists, token, concurrency=SCAN_CONCURRENCY, api_token=None):
+    """Refresh every playlist that is not already fresh, then warm track info and playcounts for Spotify tracks."""
+    engine = ScanEngine(token, concurrency, api_token)
+    index = get_index()
+    stale = [(pid, platform) for pid, platform in playlists
+             if index.age(pid) is None or index.age(pid) > REVALIDATE_INTERVAL]
+
+    async def refresh(playlist_id, platform):
+        try:
+            await engine.shared_index_playlist(playlist_id, platform)
+        except Exception as e:
+            print(f"Crawler refresh error for {playlist_id}: {e}")
+
+    await asyncio.gather(*(refresh(pid, platform) for pid, platform in stale))
+    tracks = [track for pid, platform in playlists if platform == "spotify"
+              for _, track in index.playlist_tracks(pid)]
+    try:
+        await engine.enrich_tracks(tracks)
+    except Exception as e:
+        print(f"Crawler enrichment error: {e}")
+    return {"playlists": len(playlists), "refreshed": len(stale), "tracks": len(tracks)}
+
+
+def crawl_once(playlists_file=PLAYLISTS_FILE, token_provider=load_token):
+    api_token = load_api_token()
+    token = token_provider()
+    if not token and not api_token:
+        print("Crawler: no Spotify token available, skipping run")
+        return None
+    future = asyncio.run_coroutine_threadsafe(crawl(load_playlists(playlists_file), token, api_token=api_token),
+                                              get_loop())
+    return future.result()
+
+
+class Crawler:
+    def __init__(self, playlists_file=PLAYLISTS_FILE, token_provider=load_token):
+        self.playlists_file = playlists_file
+        self.token_provider = token_provider
+        self.last_run = None
+        self.last_stats = None
+        self._stop = threading.Event()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            started = datetime.now()
+            clock = time.monotonic()
+            try:
+                self.last_stats = crawl_once(self.playlists_file, self.token_provider)
+            except Exception as e:
+                print(f"Crawler error: {e}")
+            self.last_run = started
+            print(f"Crawler run at {started:%Y-%m-%d %H:%M} done in {time.monotonic() - clock:.0f}s: {self.last_stats}")
+            wait = (next_run(started) - datetime.now()).total_seconds()
+            self._stop.wait(max(wait, 0))
+
+    def stop(self):
+        self._stop.set()
+
+
+_crawler = None
+_crawler_lock = threading.Lock()
+
+
+def start_background_crawler(playlists_file=PLAYLISTS_FILE, token_provider=load_token):
+    """Start the crawler thread once per process; later calls return the running crawler."""
+    global _crawler
+    with _crawler_lock:
+        if _crawler is None:
+            _crawler = Crawler(playlists_file, token_provider)
+            threading.Thread(target=_crawler.run_forever, name="crawler", daemon=True).start()
+        return _crawler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefetch all tracked playlists on a schedule.")
+    parser.add_argument("--once", action="store_true", help="crawl once and exit")
+    parser.add_argument("--playlists", default=PLAYLISTS_FILE)
+    args = parser.parse_args()
+    if args.once:
+        print(crawl_once(args.playlists))
+        return
+    Crawler(args.playlists).run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""
+display formatting shared by the app, the PDF report and the scan engine (no third-party imports)
+"""
+
+
+def format_number(n):
+    return format(n, ",").replace(",", ".")
@@ -0,0 +1,173 @@
+"""
+shared HTTP client layer: keep-alive connection pools and rate limiting per API host
+"""
+
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from rate_limit import get_scheduler, parse_retry_after
+
+DEFAULT_TIMEOUT = 15  # seconds
+MAX_RETRIES = 3  # retries after a 429 / quota error
+
+# Connections kept open per host; everything else (image CDNs, ...) gets DEFAULT_POOL_SIZE
+POOL_SIZES = {
+    "api.spotify.com": 32,
+    "api-partner.spotify.com": 16,
+    "api.deezer.com": 16,
+    "api.notion.com": 4,
+}
+DEFAULT_POOL_SIZE = 8
+
+DEEZER_QUOTA_ERROR = 4
+
+_sessions = {}
+_async_clients = {}
+_lock = threading.Lock()
+
+
+class ApiError(Exception):
+    pass
+
+
+def host_of(url):
+    return urlsplit(url).hostname or ""
+
+
+def endpoint_class(url, params=None):
+    # "/v1/playlists/*/tracks", "/pathfinder/v1/query getAlbum": IDs dropped, the query operation kept
+    parts = urlsplit(url)
+    path = "/".join("*" if segment.isdigit() or len(segment) >= 16 else segment for segment in parts.path.split("/"))
+    query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+    query.update(params or {})
+    operation = query.get("operationName") or query.get("fields")
+    return f"{path} {operation}" if operation else path
+
+
+def pool_size(host):
+    return POOL_SIZES.get(host, DEFAULT_POOL_SIZE)
+
+
+def get_session(host):
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size(host))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def scheduler_for(host):
+    return get_scheduler(host, pool_size(host))
+
+
+def error_payload(response):
+    # Deezer reports errors (including its quota) as HTTP 200 with an "error" object
+    if b'"error"' not in response.content[:200]:
+        return None
+    try:
+        data = json.loads(response.content)
+    except ValueError:
+        return None
+    return data.get("error") if isinstance(data, dict) else None
+
+
+def is_rate_limited(response):
+    if response.status_code == 429:
+        return True
+    error = error_payload(response)
+    return isinstance(error, dict) and error.get("code") == DEEZER_QUOTA_ERROR
+
+
+def record(host, response, latency, rate_limited):
+    metrics.inc("http_requests_total", host=host, status=response.status_code)
+    metrics.inc("http_response_bytes_total", len(response.content), host=host)
+    metrics.observe("http_request_seconds", latency, host=host)
+    if rate_limited:
+        metrics.inc("http_rate_limited_total", host=host)
+
+
+def json_or_raise(response):
+    """Decode a JSON response, raising ApiError for HTTP errors and error payloads so they are never stored."""
+    if response.status_code >= 400:
+        raise ApiError(f"{response.status_code} from {response.url}")
+    data = response.json()
+    if isinstance(data, dict) and "error" in data:
+        raise ApiError(f"error payload from {response.url}: {data['error']}")
+    return data
+
+
+def request(method, url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    host = host_of(url)
+    scheduler = scheduler_for(host)
+    endpoint = endpoint_class(url, kwargs.get("params"))
+    for attempt in range(MAX_RETRIES + 1):
+        scheduler.acquire()
+        started = time.monotonic()
+        try:
+            response = get_session(host).request(method, url, timeout=timeout, **kwargs)
+        except Exception:
+            scheduler.release(None)
+            metrics.inc("http_errors_total", host=host)
+            raise
+        rate_limited = is_rate_limited(response)
+        record(host, response, time.monotonic() - started, rate_limited)
+        scheduler.release(time.monotonic() - started, rate_limited,
+                          parse_retry_after(response.headers.get("Retry-After")), endpoint)
+        if not rate_limited or attempt == MAX_RETRIES:
+            return response
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+# --- async ---
+# Async clients are bound to the event loop they were first used on, i.e. the scan engine loop
+
+def get_async_client(host):
+    client = _async_clients.get(host)
+    if client is None:
+        size = pool_size(host)
+        client = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT,
+            limits=httpx.Limits(max_connections=size, max_keepalive_connections=size, keepalive_expiry=60),
+        )
+        _async_clients[host] = client
+    return client
+
+
+async def async_request(method, url, **kwargs):
+    host = host_of(url)
+    scheduler = scheduler_for(host)
+    endpoint = endpoint_class(url, kwargs.get("params"))
+    for attempt in range(MAX_RETRIES + 1):
+        await scheduler.acquire_async()
+        started = time.monotonic()
+        try:
+            response = await get_async_client(host).request(method, url, **kwargs)
+        except (Exception, asyncio.CancelledError):
+            scheduler.release(None)
+            metrics.inc("http_errors_total", host=host)
+            raise
+        rate_limited = is_rate_limited(response)
+        record(host, response, time.monotonic() - started, rate_limited)
+        scheduler.release(time.monotonic() - started, rate_limited,
+                          parse_retry_after(response.headers.get("Retry-After")), endpoint)
+        if not rate_limited or attempt == MAX_RETRIES:
+            return response
@@ -0,0 +1,154 @@
+"""
+shared cover image cache: pre-resized JPEG thumbnails keyed by a hash of the image URL
+
+The first request for a URL downloads the image once and stores it at every THUMBNAIL_SIZES
+width; the PDF renderer and the results page then only read bytes from SQLite. Least recently
+used thumbnails are evicted above IMAGE_CACHE_MAX_BYTES.
+"""
+
+import base64
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import http_client
+import metrics
+from storage import LruTable, connect
+
+IMAGE_DB = "images.sqlite"
+MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+THUMBNAIL_SIZES = (80, 200, 300)
+JPEG_QUALITY = 85
+FETCH_WORKERS = 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS thumbnails (
+    url_hash TEXT NOT NULL,
+    px INTEGER NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (url_hash, px)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS thumbnails_accessed ON thumbnails (accessed_at);
+"""
+
+
+def url_hash(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def resize(data, sizes):
+    """{px: JPEG bytes} of `data` scaled to fit px x px, for every px in `sizes`."""
+    # PIL is only needed on a cache miss, keep it off the import path of every page run
+    from PIL import Image
+
+    original = Image.open(BytesIO(data)).convert("RGB")
+    thumbnails = {}
+    for px in sorted(sizes, reverse=True):
+        image = original.copy()
+        image.thumbnail((px, px), Image.LANCZOS)
+        out = BytesIO()
+        image.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        thumbnails[px] = out.getvalue()
+    return thumbnails
+
+
+class ImageCache:
+    def __init__(self, filename=IMAGE_DB, max_bytes=MAX_BYTES):
+        self._lock = threading.Lock()
+        self._conn = connect(filename)
+        self._conn.executescript(SCHEMA)
+        self._table = LruTable(self._conn, "thumbnails", ["url_hash", "px"], max_bytes)
+        self._executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="images")
+        self._pending = set()
+
+    def get_many(self, urls, px):
+        """{url: JPEG bytes} for the URLs whose px thumbnail is cached; never downloads."""
+        hashes = {url_hash(url): url for url in urls if url}
+        with self._lock:
+            rows = self._table.get_many("value", [(key, px) for key in hashes])
+        found = {hashes[key]: value for key, _, value in rows}
+        metrics.inc("cache_lookups_total", len(found), tier="images", result="hit")
+        metrics.inc("cache_lookups_total", len(hashes) - len(found), tier="images", result="miss")
+        return found
+
+    def get(self, url, px):
+        return self.get_many([url], px).get(url)
+
+    def _store(self, url, thumbnails):
+        now = time.time()
+        rows = [(url_hash(url), px, value, len(value), now) for px, value in thumbnails.items()]
+        with self._lock:
+            self._table.replace(["url_hash", "px", "value", "size", "accessed_at"], rows)
+
+    def _fetch(self, url, px):
+        # One download per URL yields every standard size (plus px, for a non-standard request)
+        try:
+            response = http_client.get(url)
+            if response.status_code >= 400:
+                raise http_client.ApiError(f"{response.status_code} from {url}")
+            thumbnails = resize(response.content, set(THUMBNAIL_SIZES) | {px})
+        except Exception as e:
+            print(f"Image error for {url}: {e}")
+            return None
+        self._store(url, thumbnails)
+        return thumbnails[px]
+
+    def thumbnails(self, urls, px):
+        """{url: JPEG bytes} for `urls` at px, downloading the missing ones in parallel; failed URLs are left out."""
+        urls = list(dict.fromkeys(url for url in urls if url))
+        found = self.get_many(urls, px)
+        missing = [url for url in urls if url not in found]
+        for url, value in zip(missing, self._executor.map(lambda url: self._fetch(url, px), missing)):
+            if value is not None:
+                found[url] = value
+        return found
+
+    def thumbnail(self, url, px):
+        return self.thumbnails([url], px).get(url)
+
+    def _prefetch(self, urls, px):
+        # Background download of uncached thumbnails, at most one per URL at a time
+        with self._lock:
+            missing = [url for url in urls if (url, px) not in self._pending]
+            self._pending.update((url, px) for url in missing)
+
+        def fetch(url):
+            try:
+                self._fetch(url, px)
+            finally:
+                with self._lock:
+                    self._pending.discard((url, px))
+
+        for url in missing:
+            self._executor.submit(fetch, url)
+
+    def image_src(self, urls, px):
+        """{url: src} for <img> tags: a data URI for cached thumbnails, the original URL (fetched in the background)
+        for the rest."""
+        urls = list(dict.fromkeys(url for url in urls if url))
+        found = self.get_many(urls, px)
+        self._prefetch([url for url in urls if url not in found], px)
+        return {url: f"data:image/jpeg;base64,{base64.b64encode(found[url]).decode()}" if url in found else url
+                for url in urls}
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(DISTINCT url_hash) FROM thumbnails").fetchone()[0]
+            return {"images": entries, "bytes": self._table.size, "max_bytes": self._table.max_bytes}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache()
+        return _cache
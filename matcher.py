@@ -0,0 +1,53 @@
+"""
+multi-pattern substring matching (Aho-Corasick)
+"""
+
+from collections import deque
+
+
+class MultiMatcher:
+    """Finds which of many patterns occur in a text with a single pass over the text."""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [set()]
+        for number, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(set())
+                node = next_node
+            self._out[node].add(number)
+        # Breadth-first: a node's fail link points at its longest proper suffix in the trie
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] |= self._out[self._fail[child]]
+
+    def find(self, text):
+        """Return the set of pattern numbers contained in `text`."""
+        found = set()
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                found |= out[node]
+        return found
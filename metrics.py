@@ -0,0 +1,234 @@
+"""
+process-wide scan metrics: counters and latency histograms, exported as JSON or Prometheus text
+
+Recording is a dict update under one lock, cheap enough to stay on in production.
+METRICS_PORT serves /metrics (Prometheus) and /metrics.json over HTTP; METRICS_JSON_PATH
+and METRICS_PROM_PATH are rewritten after every scan for file-based collectors.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HELP = {
+    "http_requests_total": "HTTP responses by host and status",
+    "http_response_bytes_total": "Response body bytes by host",
+    "http_rate_limited_total": "429s and Deezer quota errors by host",
+    "http_errors_total": "Requests that failed without a response, by host",
+    "http_request_seconds": "Request latency by host",
+    "cache_lookups_total": "API cache lookups by tier and result",
+    "scan_phase_seconds": "Time spent per scan pipeline phase",
+    "scans_total": "Completed scans",
+    "page_run_seconds": "Streamlit script run time per rerun",
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_started = time.time()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * (len(LATENCY_BUCKETS) + 1), "sum": 0.0, "count": 0}
+        histogram["buckets"][bisect_left(LATENCY_BUCKETS, value)] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def phase(name):
+    return timer("scan_phase_seconds", phase=name)
+
+
+def timed(name):
+    """Decorator recording every call of a (sync or async) function as scan phase `name`."""
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with phase(name):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with phase(name):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def histogram_count(name, **labels):
+    with _lock:
+        histogram = _histograms.get(_key(name, labels))
+        return histogram["count"] if histogram else 0
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _quantile(histogram, share):
+    # Upper bound of the bucket holding the share-th observation
+    if not histogram["count"]:
+        return None
+    rank = share * histogram["count"]
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), histogram["buckets"]):
+        seen += count
+        if seen >= rank:
+            return bound
+    return float("inf")
+
+
+def snapshot():
+    """All metrics as plain data: {"counters": [...], "histograms": [...]}."""
+    with _lock:
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(_counters.items())]
+        histograms = [
+            {"name": name, "labels": dict(labels), "count": h["count"], "sum": h["sum"],
+             "p50": _quantile(h, 0.5), "p99": _quantile(h, 0.99), "buckets": list(h["buckets"])}
+            for (name, labels), h in sorted(_histograms.items())
+        ]
+    return {"started_at": _started, "generated_at": time.time(), "buckets": list(LATENCY_BUCKETS),
+            "counters": counters, "histograms": histograms}
+
+
+def counter_totals(name, label):
+    # {label value: summed counter} for one counter name, e.g. requests per host
+    totals = {}
+    for counter in snapshot()["counters"]:
+        if counter["name"] == name:
+            value = counter["labels"].get(label)
+            totals[value] = totals.get(value, 0) + counter["value"]
+    return totals
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=None):
+    items = list(labels.items()) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def to_prometheus(prefix="playlist_scanner_"):
+    data = snapshot()
+    lines = []
+    typed = set()
+    for counter in data["counters"]:
+        name = prefix + counter["name"]
+        if name not in typed:
+            lines += [f"# HELP {name} {HELP.get(counter['name'], counter['name'])}", f"# TYPE {name} counter"]
+            typed.add(name)
+        lines.append(f"{name}{_labels(counter['labels'])} {counter['value']}")
+    for histogram in data["histograms"]:
+        name = prefix + histogram["name"]
+        if name not in typed:
+            lines += [f"# HELP {name} {HELP.get(histogram['name'], histogram['name'])}", f"# TYPE {name} histogram"]
+            typed.add(name)
+        cumulative = 0
+        for bound, count in zip(data["buckets"] + ["+Inf"], histogram["buckets"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(histogram['labels'], {'le': bound})} {cumulative}")
+        lines.append(f"{name}_sum{_labels(histogram['labels'])} {histogram['sum']}")
+        lines.append(f"{name}_count{_labels(histogram['labels'])} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def write_json(path):
+    _write_atomic(path, json.dumps(snapshot(), indent=2))
+
+
+def export_files():
+    """Rewrite the METRICS_JSON_PATH / METRICS_PROM_PATH files, if configured."""
+    try:
+        if os.environ.get("METRICS_JSON_PATH"):
+            write_json(os.environ["METRICS_JSON_PATH"])
+        if os.environ.get("METRICS_PROM_PATH"):
+            _write_atomic(os.environ["METRICS_PROM_PATH"], to_prometheus())
+    except OSError as e:
+        print(f"Metrics export error: {e}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, content_type = json.dumps(snapshot()).encode("utf-8"), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = to_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port=None):
+    """Serve the metrics on METRICS_PORT (or `port`) once per process; does nothing when neither is set."""
+    global _server
+    port = port or os.environ.get("METRICS_PORT")
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            except OSError as e:
+                # Another process of the deployment already serves this port
+                print(f"Metrics server error: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server
@@ -0,0 +1,48 @@
+"""
+normalized match keys for artist names and track titles
+"""
+
+import re
+import unicodedata
+
+# "Song (feat. X)", "Song [ft. X & Y]", "Song - featuring X", "Song feat. X"
+FEATURE_RE = re.compile(
+    r"[\(\[]\s*(?:feat\.?|ft\.?|featuring|with)\s+([^\)\]]*)[\)\]]|\s+-?\s*(?:feat\.?|ft\.?|featuring)\s+(.*)$"
+)
+ARTIST_SPLIT_RE = re.compile(r"\s*(?:,|&|\band\b|\bx\b)\s*")
+
+
+def normalize(text):
+    """Casefolded, NFKD-decomposed, accent- and punctuation-free form of `text` ("Beyoncé" -> "beyonce")."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).casefold()
+    text = "".join(char if char.isalnum() else " " for char in text)
+    return " ".join(text.split())
+
+
+def split_features(title):
+    # ("Song", ["X & Y", "X", "Y"]) for "Song (feat. X & Y)"; the unsplit credit keeps "Earth, Wind & Fire" whole
+    featured = []
+
+    def strip(match):
+        credit = (match.group(1) or match.group(2) or "").strip()
+        featured.append(credit)
+        featured.extend(name for name in ARTIST_SPLIT_RE.split(credit) if name and name != credit)
+        return ""
+
+    return FEATURE_RE.sub(strip, title or ""), featured
+
+
+def match_keys(name, artists):
+    """Match keys stored with every indexed track: normalized title with and without credits, artists and artists
+    featured in the title."""
+    full_title = unicodedata.normalize("NFKC", name or "").casefold()
+    title, featured = split_features(full_title)
+    artist_keys = [key for key in (normalize(artist) for artist in artists) if key]
+    featured_keys = dict.fromkeys(key for key in (normalize(artist) for artist in featured) if key)
+    return {
+        "name": normalize(title),
+        "title": normalize(full_title),
+        "artists": artist_keys,
+        "featured": [key for key in featured_keys if key not in artist_keys],
+    }
@@ -1,5 +1,5 @@
 import streamlit as st
-import hashlib, requests, json
+import hashlib, json
 from datetime import datetime
 
 NOTION_TOKEN = st.secrets["NOTION_TOKEN"]
@@ -9,6 +9,7 @@ NOTION_VERSION = "2022-06-28"
 st.set_page_config(page_title="Registration", layout="wide")
 st.title("Registration")
 
+import http_client
 from utils import load_css
 load_css()
 
@@ -27,7 +28,7 @@ def email_exists(email):
         "Content-Type": "application/json"
     }
     payload = {"filter": {"property": "Email", "title": {"equals": email}}}
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
+    response = http_client.post(url, headers=headers, data=json.dumps(payload))
     data = response.json()
     return len(data.get("results", [])) > 0
 
@@ -51,7 +52,7 @@ def add_user_to_notion(email, first_name, last_name, password_hash):
             "Date created": {"date": {"start": datetime.utcnow().isoformat()}}
         }
     }
-    response = requests.post(url, headers=headers, data=json.dumps(data))
+    response = http_client.post(url, headers=headers, data=json.dumps(data))
     return response.status_code == 200
 
 if not st.session_state.registered:
@@ -0,0 +1,87 @@
+"""
+background PDF rendering, memoised by a content hash of the results
+
+Identical results (same query, same tracks and playlists) map to one report, rendered once in a
+worker thread and shared by every session that asks for it. Reports are kept in memory as bytes,
+bounded by PDF_MAX_REPORTS and PDF_STORE_MAX_BYTES.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_report import render_pdf
+
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "2"))
+MAX_REPORTS = int(os.environ.get("PDF_MAX_REPORTS", "32"))  # finished reports kept before the oldest is dropped
+MAX_BYTES = int(os.environ.get("PDF_STORE_MAX_BYTES", 64 * 1024 * 1024))
+
+_executor = ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix="pdf")
+_jobs = OrderedDict()
+_lock = threading.Lock()
+
+
+def report_key(results, query):
+    payload = json.dumps([query, results], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _render(results, query):
+    try:
+        data = render_pdf(results, query)
+    except Exception as e:
+        print(f"PDF error for {query}: {e}")
+        raise
+    with _lock:
+        _evict(len(data))
+    return data
+
+
+def _size(job):
+    return len(job.result()) if job.done() and job.exception() is None else 0
+
+
+def _evict(incoming=0):
+    # Drop the oldest finished reports beyond MAX_REPORTS or MAX_BYTES; running jobs are never dropped
+    total = incoming + sum(_size(job) for job in _jobs.values())
+    count = len(_jobs)
+    for key in [key for key, job in _jobs.items() if job.done()]:
+        if count <= MAX_REPORTS and total <= MAX_BYTES:
+            break
+        total -= _size(_jobs.pop(key))
+        count -= 1
+
+
+def submit(results, query):
+    """Start rendering the report for `results` unless it is already rendered or running; returns its key."""
+    key = report_key(results, query)
+    with _lock:
+        if key in _jobs:
+            _jobs.move_to_end(key)
+        else:
+            _jobs[key] = _executor.submit(_render, results, query)
+            _evict()
+    return key
+
+
+def status(key):
+    """None for an unknown key, otherwise "running", "ready" or "failed"."""
+    with _lock:
+        job = _jobs.get(key)
+    if job is None:
+        return None
+    if not job.done():
+        return "running"
+    return "failed" if job.exception() is not None else "ready"
+
+
+def result(key):
+    """PDF bytes of a ready report (None when it is not ready)."""
+    with _lock:
+        job = _jobs.get(key)
+    if job is None or not job.done() or job.exception() is not None:
+        return None
+    return job.result()
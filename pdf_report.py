@@ -0,0 +1,168 @@
+"""
+PDF report of scan results (no streamlit, shared by the app and the CLI)
+"""
+
+import os
+import re
+from datetime import datetime
+from io import BytesIO
+
+import metrics
+from formatting import format_number
+from image_cache import get_image_cache
+
+COVER_PX = 200
+BACKGROUND_PX = 1240  # A4 width at 150 dpi
+
+
+def pdf_filename(query):
+    # "AC/DC" must not become a directory
+    name = re.sub(r"[^\w.-]+", "_", query)
+    return f"playlist_scan_{name}.pdf"
+
+
+@metrics.timed("pdf")
+def render_pdf(results, query):
+    """Render `results` (scan results for `query`) to PDF bytes, entirely in memory."""
+    # fpdf is only needed here, keep it off the import path of every page run
+    from fpdf import FPDF
+
+    def safe_text(text):
+        # Remove HTML tags, especially <a ...>@diffusmagazin</a> etc.
+        if not text:
+            return ""
+        # Remove all HTML tags
+        text = re.sub(r"<[^>]+>", "", text)
+        return text.encode("latin-1", "ignore").decode("latin-1")
+
+    # --- PDF setup ---
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=False, margin=15)  # We'll manage page breaks
+    SPOTIFY_GREEN = (29, 185, 84)
+    BG_IMG_URL = os.environ.get("PDF_BACKGROUND_URL", "https://iili.io/3dchREl.jpg")
+
+    # Background and covers come pre-resized from the shared image cache, missing ones are fetched in parallel
+    image_cache = get_image_cache()
+    bg_img = image_cache.thumbnail(BG_IMG_URL, BACKGROUND_PX)
+    covers = image_cache.thumbnails(
+        [data["track"].get("cover_url") for data in results.values()]
+        + [plist.get("cover") for data in results.values() for plist in data["playlists"]],
+        COVER_PX,
+    )
+
+    def add_page_with_bg():
+        pdf.add_page()
+        if bg_img:
+            pdf.image(BytesIO(bg_img), x=0, y=0, w=210, h=297)
+
+    # For each unique track, add a section with its own page(s)
+    for key, data in results.items():
+        track = data["track"]
+        playlists = data["playlists"]
+
+        add_page_with_bg()
+
+        # Header: Track name by artist
+        track_name = track.get("name", "Unbekannt")
+        artist_names = ", ".join([a.get("name", "Unbekannt") for a in track.get("artists", [])])
+        pdf.set_font("Arial", "B", 22)
+        pdf.set_text_color(*SPOTIFY_GREEN)
+        pdf.multi_cell(0, 15, safe_text(f"{track_name} by {artist_names}"), align="C")
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_font("Arial", "", 14)
+        pdf.cell(0, 10, safe_text(f"Erstellt am: {datetime.now().strftime('%d.%m.%Y – %H:%M:%S')}"), ln=True, align="C")
+        # Track-Metadaten
+        pdf.set_font("Arial", "", 12)
+        details = []
+        if track.get("release_date"):
+            details.append(f"Released: {track['release_date']}")
+        if track.get("popularity") is not None:
+            details.append(f"Popularity: {track['popularity']}")
+        if track.get("streams") is not None:
+            details.append(f"Streams: {format_number(track['streams'])}")
+        if details:
+            pdf.ln(5)
+            pdf.multi_cell(0, 8, " | ".join(details), align="C")
+        pdf.ln(10)
+
+        # Cover image (centered)
+        cover_url = track.get("cover_url")
+        if cover_url:
+            if covers.get(cover_url):
+                pdf.ln(5)
+                # Center the image horizontally, width 60mm
+                pdf.image(BytesIO(covers[cover_url]), x=(210-60)//2, y=pdf.get_y(), w=60)
+                pdf.ln(65)
+        else:
+            pdf.ln(10)
+
+        # Playlists summary for this track
+        playlist_names = set()
+        for plist in playlists:
+            playlist_names.add(plist["name"])
+        summary = f"Der Track wurde in {len(playlist_names)} Playlist(s) gefunden. Insgesamt {len(playlists)} Platzierungen."
+        pdf.set_font("Arial", "", 13)
+        pdf.set_text_color(255, 255, 255)
+        pdf.multi_cell(0, 8, safe_text(summary))
+        pdf.ln(5)
+
+        # --- Playlists Section (for this track only) ---
+        playlist_entries = []
+        seen_playlists = set()
+        for plist in playlists:
+            pl_key = (plist.get("name", ""), plist.get("url", ""))
+            if pl_key not in seen_playlists:
+                playlist_entries.append(plist)
+                seen_playlists.add(pl_key)
+
+        ENTRIES_PER_PAGE = 3
+        for idx, plist in enumerate(playlist_entries):
+            # Add new page (with bg) every ENTRIES_PER_PAGE (except first page)
+            if idx > 0 and idx % ENTRIES_PER_PAGE == 0:
+                add_page_with_bg()
+            # Section heading
+            name = plist.get("name", "Unknown Playlist")
+            owner = plist.get("owner", "N/A")
+            followers = plist.get("followers", "N/A")
+            position = plist.get("position", "-")
+            url = plist.get("url", "")
+            desc = plist.get("description", "")
+            cover = plist.get("cover")
+
+            pdf.set_fill_color(*SPOTIFY_GREEN)
+            pdf.set_text_color(255, 255, 255)
+            pdf.set_font("Arial", "B", 13)
+            pdf.cell(0, 10, safe_text(f"Playlist: {name}"), ln=True, fill=True)
+            pdf.set_text_color(255, 255, 255)
+            pdf.set_font("Arial", "", 12)
+            pdf.cell(0, 8, safe_text(f"Kurator: {owner} – Follower: {followers} – Position: {position}"), ln=True)
+            if desc:
+                pdf.set_font("Arial", "", 11)
+                pdf.multi_cell(0, 7, safe_text(desc))
+            if url:
+                pdf.set_text_color(29, 185, 84)
+                pdf.cell(0, 8, safe_text(url), ln=True, link=url)
+                pdf.set_text_color(255, 255, 255)
+
+            # Playlist cover image
+            if covers.get(cover):
+                y = pdf.get_y()
+                pdf.image(BytesIO(covers[cover]), x=170, y=y - 25, w=30)
+
+            # Layout improvements: add spacing and section divider
+            pdf.ln(6)
+            pdf.set_draw_color(*SPOTIFY_GREEN)
+            pdf.set_line_width(0.8)
+            pdf.line(pdf.l_margin, pdf.get_y(), 210 - pdf.r_margin, pdf.get_y())
+            pdf.ln(4)
+
+    # --- PDF Output ---
+    return bytes(pdf.output())
+
+
+def generate_pdf(results, query, output_filename=None):
+    """Render `results` to a PDF file and return its path (for the CLI; the app keeps the bytes)."""
+    output_filename = output_filename or pdf_filename(query)
+    with open(output_filename, "wb") as f:
+        f.write(render_pdf(results, query))
+    return output_filename
@@ -0,0 +1,132 @@
+"""
+append-only history of playlist placements: which track sat at which position when
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from storage import connect, select_in
+
+PLACEMENTS_DB = "placements.sqlite"
+
+# Playlist and track IDs are interned to integers; observations are keyed (track, playlist, time)
+# so the history of one track is a single range scan of the primary key.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlist_ids (
+    id INTEGER PRIMARY KEY,
+    playlist_id TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS track_ids (
+    id INTEGER PRIMARY KEY,
+    track_id TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    playlist INTEGER NOT NULL,
+    observed_at INTEGER NOT NULL,
+    PRIMARY KEY (playlist, observed_at)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS observations (
+    track INTEGER NOT NULL,
+    playlist INTEGER NOT NULL,
+    observed_at INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (track, playlist, observed_at)
+) WITHOUT ROWID;
+"""
+
+
+class PlacementStore:
+    def __init__(self, filename=PLACEMENTS_DB):
+        self._lock = threading.Lock()
+        self._conn = connect(filename)
+        self._conn.executescript(SCHEMA)
+
+    def _intern(self, table, column, values):
+        values = list(values)
+        self._conn.executemany(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", [(v,) for v in values])
+        return dict(select_in(self._conn, f"SELECT {column}, id FROM {table} WHERE {column} IN ({{keys}})", values))
+
+    def _id(self, table, column, value):
+        row = self._conn.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,)).fetchone()
+        return row[0] if row else None
+
+    def record(self, playlist_id, placements, observed_at=None):
+        """Store one fetched snapshot of a playlist. `placements` is [(position, track_id), ...]."""
+        observed_at = int(observed_at if observed_at is not None else time.time())
+        placements = [(position, str(track_id)) for position, track_id in placements if track_id]
+        with self._lock:
+            with self._conn:
+                playlist = self._intern("playlist_ids", "playlist_id", [playlist_id])[playlist_id]
+                tracks = self._intern("track_ids", "track_id", {track_id for _, track_id in placements})
+                self._conn.execute("INSERT OR IGNORE INTO snapshots (playlist, observed_at) VALUES (?, ?)",
+                                   (playlist, observed_at))
+                # A track listed twice keeps its first position
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO observations (track, playlist, observed_at, position) VALUES (?, ?, ?, ?)",
+                    [(tracks[track_id], playlist, observed_at, position) for position, track_id in placements],
+                )
+
+    def position_history(self, track_id, playlist_id):
+        """Return [(observed_at, position), ...] of `track_id` in `playlist_id`, oldest first."""
+        with self._lock:
+            track = self._id("track_ids", "track_id", str(track_id))
+            playlist = self._id("playlist_ids", "playlist_id", playlist_id)
+            if track is None or playlist is None:
+                return []
+            return self._conn.execute(
+                "SELECT observed_at, position FROM observations WHERE track = ? AND playlist = ? ORDER BY observed_at",
+                (track, playlist),
+            ).fetchall()
+
+    def spans(self, track_id, playlist_id=None):
+        """Return the stretches a track was listed: [{"playlist_id", "added", "removed", "positions"}, ...].
+
+        "added" is the first snapshot that contained the track, "removed" the first later snapshot that
+        did not (None while it is still listed).
+        """
+        with self._lock:
+            track = self._id("track_ids", "track_id", str(track_id))
+            if track is None:
+                return []
+            query = ("SELECT p.playlist_id, o.playlist, o.observed_at, o.position FROM observations o "
+                     "JOIN playlist_ids p ON p.id = o.playlist WHERE o.track = ?")
+            args = [track]
+            if playlist_id is not None:
+                query += " AND p.playlist_id = ?"
+                args.append(playlist_id)
+            by_playlist = defaultdict(list)
+            names = {}
+            for name, playlist, observed_at, position in self._conn.execute(query + " ORDER BY o.observed_at", args):
+                by_playlist[playlist].append((observed_at, position))
+                names[playlist] = name
+            spans = []
+            for playlist, observations in by_playlist.items():
+                snapshots = [row[0] for row in self._conn.execute(
+                    "SELECT observed_at FROM snapshots WHERE playlist = ? AND observed_at >= ? ORDER BY observed_at",
+                    (playlist, observations[0][0]),
+                )]
+                seen = dict(observations)
+                span = None
+                for snapshot in snapshots:
+                    if snapshot in seen:
+                        if span is None:
+                            span = {"playlist_id": names[playlist], "added": snapshot, "removed": None, "positions": []}
+                            spans.append(span)
+                        span["positions"].append((snapshot, seen[snapshot]))
+                    elif span is not None:
+                        span["removed"] = snapshot
+                        span = None
+            return sorted(spans, key=lambda span: span["added"])
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_placement_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PlacementStore()
+        return _store
@@ -0,0 +1,41 @@
+"""
+persistent Spotify playcount store
+"""
+
+import threading
+
+from api_cache import get_api_cache
+
+# Playcounts live in the API cache's short tier; its TTL (PLAYCOUNT_MAX_AGE, 6 h by default) is the freshness window
+PLAYCOUNT_TIER = "short"
+
+
+def playcount_key(track_id):
+    return f"playcount:{track_id}"
+
+
+class PlaycountStore:
+    def __init__(self, cache=None):
+        self._cache = cache or get_api_cache()
+
+    def get_many(self, track_ids):
+        """Return {track_id: playcount} for the IDs with a fresh stored playcount."""
+        keys = {playcount_key(track_id): track_id for track_id in track_ids}
+        return {keys[key]: playcount for key, playcount in self._cache.get_many(keys, PLAYCOUNT_TIER).items()}
+
+    def put_many(self, playcounts):
+        self._cache.set_many(
+            {playcount_key(track_id): playcount for track_id, playcount in playcounts.items()}, PLAYCOUNT_TIER
+        )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_playcount_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PlaycountStore()
+        return _store
@@ -0,0 +1,322 @@
+"""
+persistent inverted index over the tracked playlists
+"""
+
+import copy
+import json
+import threading
+import time
+from collections import defaultdict
+
+from matcher import MultiMatcher
+from normalize import match_keys, normalize
+from storage import connect
+
+INDEX_DB = "playlist_index.sqlite"
+KEYS_VERSION = 2  # bump when normalize.match_keys changes; stored keys and postings are rebuilt on open
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    playlist_id TEXT PRIMARY KEY,
+    platform TEXT NOT NULL,
+    meta TEXT NOT NULL,
+    version TEXT,
+    updated_at REAL NOT NULL,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    playlist_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    track TEXT NOT NULL,
+    PRIMARY KEY (playlist_id, position)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    playlist_id TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS postings_key ON postings (kind, key);
+CREATE INDEX IF NOT EXISTS postings_playlist ON postings (playlist_id);
+"""
+
+
+def match_key(text):
+    return normalize(text)
+
+
+def id_key(track_id):
+    return str(track_id or "").strip()
+
+
+def slim_track(track, platform):
+    # Only keep what matching, enrichment and rendering need, plus the precomputed match keys
+    if platform == "spotify":
+        album = track.get("album") or {}
+        slim = {
+            "id": track.get("id"),
+            "name": track.get("name", ""),
+            "artists": [{"name": a.get("name", ""), "id": a.get("id")} for a in track.get("artists", [])],
+            "album": {
+                "id": album.get("id"),
+                "release_date": album.get("release_date"),
+                "images": album.get("images", []),
+            },
+            "popularity": track.get("popularity"),
+        }
+    else:
+        slim = {
+            "id": track.get("id"),
+            "title": track.get("title", ""),
+            "artist": track.get("artist", {}),
+            "album": track.get("album", {}),
+            "rank": track.get("rank", 0),
+        }
+    slim["keys"] = compute_keys(slim, platform)
+    return slim
+
+
+def compute_keys(track, platform):
+    if platform == "spotify":
+        return match_keys(track.get("name", ""), [a.get("name", "") for a in track.get("artists", [])])
+    return match_keys(track.get("title", ""), [track.get("artist", {}).get("name", "")])
+
+
+def track_keys(track, platform):
+    keys = track.get("keys") or compute_keys(track, platform)
+    postings = {("track", keys["name"]), ("track", keys.get("title")), ("id", id_key(track.get("id")))}
+    postings.update(("artist", artist) for artist in keys["artists"] + keys["featured"])
+    return {(kind, key) for kind, key in postings if key}
+
+
+class PlaylistIndex:
+    def __init__(self, filename=INDEX_DB):
+        self._lock = threading.RLock()
+        self._conn = connect(filename)
+        self._conn.executescript(SCHEMA)
+        self._migrate_keys()
+        self._meta = {}
+        self._versions = {}
+        self._updated = {}
+        self._checked = {}
+        self._entries = {}
+        self._postings = defaultdict(set)
+        self._data_version = None
+        self._sync()
+
+    def _migrate_keys(self):
+        # Recompute match keys and postings from the stored tracks instead of refetching every playlist
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] >= KEYS_VERSION:
+            return
+        platforms = dict(self._conn.execute("SELECT playlist_id, platform FROM playlists"))
+        entries = []
+        postings = []
+        for playlist_id, position, track in self._conn.execute("SELECT playlist_id, position, track FROM entries"):
+            platform = platforms.get(playlist_id, "spotify")
+            track = json.loads(track)
+            track["keys"] = compute_keys(track, platform)
+            entries.append((json.dumps(track), playlist_id, position))
+            postings.extend((kind, key, playlist_id, position) for kind, key in track_keys(track, platform))
+        with self._conn:
+            self._conn.executemany("UPDATE entries SET track = ? WHERE playlist_id = ? AND position = ?", entries)
+            self._conn.execute("DELETE FROM postings")
+            self._conn.executemany(
+                "INSERT INTO postings (kind, key, playlist_id, position) VALUES (?, ?, ?, ?)", postings
+            )
+            self._conn.execute(f"PRAGMA user_version = {KEYS_VERSION}")
+
+    def _load_playlist(self, playlist_id):
+        self._drop_playlist(playlist_id)
+        row = self._conn.execute(
+            "SELECT platform, meta, version, updated_at, checked_at FROM playlists WHERE playlist_id = ?",
+            (playlist_id,),
+        ).fetchone()
+        if not row:
+            return
+        platform, meta, version, updated_at, checked_at = row
+        self._meta[playlist_id] = dict(json.loads(meta), platform=platform)
+        self._versions[playlist_id] = json.loads(version) if version else {}
+        self._updated[playlist_id] = updated_at
+        self._checked[playlist_id] = checked_at
+        self._entries[playlist_id] = {
+            position: json.loads(track)
+            for position, track in self._conn.execute(
+                "SELECT position, track FROM entries WHERE playlist_id = ?", (playlist_id,)
+            )
+        }
+        for kind, key, position in self._conn.execute(
+            "SELECT kind, key, position FROM postings WHERE playlist_id = ?", (playlist_id,)
+        ):
+            self._postings[(kind, key)].add((playlist_id, position))
+
+    def _drop_playlist(self, playlist_id):
+        for position, track in self._entries.pop(playlist_id, {}).items():
+            platform = self._meta.get(playlist_id, {}).get("platform", "spotify")
+            for posting_key in track_keys(track, platform):
+                postings = self._postings.get(posting_key)
+                if postings:
+                    postings.discard((playlist_id, position))
+                    if not postings:
+                        del self._postings[posting_key]
+        self._meta.pop(playlist_id, None)
+        self._versions.pop(playlist_id, None)
+        self._updated.pop(playlist_id, None)
+        self._checked.pop(playlist_id, None)
+
+    def _sync(self):
+        # Pick up playlists written by other processes since the last look; data_version only moves
+        # on their commits, our own writes are loaded as they happen
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        stored = {
+            playlist_id: (updated_at, checked_at)
+            for playlist_id, updated_at, checked_at in self._conn.execute(
+                "SELECT playlist_id, updated_at, checked_at FROM playlists"
+            )
+        }
+        for playlist_id in set(self._updated) - set(stored):
+            self._drop_playlist(playlist_id)
+        for playlist_id, (updated_at, checked_at) in stored.items():
+            if self._updated.get(playlist_id) != updated_at:
+                self._load_playlist(playlist_id)
+            else:
+                self._checked[playlist_id] = checked_at
+
+    def update_playlist(self, playlist_id, platform, meta, tracks, version=None):
+        """Replace the indexed contents of one playlist. `tracks` is in playlist order and may contain None."""
+        entries = [
+            (position, slim_track(track, platform))
+            for position, track in enumerate(tracks, start=1)
+            if track
+        ]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM entries WHERE playlist_id = ?", (playlist_id,))
+                self._conn.execute("DELETE FROM postings WHERE playlist_id = ?", (playlist_id,))
+                self._conn.executemany(
+                    "INSERT INTO entries (playlist_id, position, track) VALUES (?, ?, ?)",
+                    [(playlist_id, position, json.dumps(track)) for position, track in entries],
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (kind, key, playlist_id, position) VALUES (?, ?, ?, ?)",
+                    [
+                        (kind, key, playlist_id, position)
+                        for position, track in entries
+                        for kind, key in track_keys(track, platform)
+                    ],
+                )
+                now = time.time()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO playlists (playlist_id, platform, meta, version, updated_at, checked_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (playlist_id, platform, json.dumps(meta), json.dumps(version or {}), now, now),
+                )
+            self._load_playlist(playlist_id)
+
+    def update_meta(self, playlist_id, meta, version):
+        # Track list is unchanged (same snapshot/checksum), only metadata may have moved
+        with self._lock:
+            current = dict(self._meta.get(playlist_id, {}))
+            current.pop("platform", None)
+            if current == meta and self._versions.get(playlist_id) == version:
+                self.mark_checked(playlist_id)
+                return
+            with self._conn:
+                now = time.time()
+                self._conn.execute(
+                    "UPDATE playlists SET meta = ?, version = ?, updated_at = ?, checked_at = ? WHERE playlist_id = ?",
+                    (json.dumps(meta), json.dumps(version), now, now, playlist_id),
+                )
+            self._load_playlist(playlist_id)
+
+    def mark_checked(self, playlist_id):
+        with self._lock:
+            with self._conn:
+                now = time.time()
+                self._conn.execute("UPDATE playlists SET checked_at = ? WHERE playlist_id = ?", (now, playlist_id))
+            if playlist_id in self._checked:
+                self._checked[playlist_id] = now
+
+    def playlist_version(self, playlist_id):
+        with self._lock:
+            return dict(self._versions.get(playlist_id, {}))
+
+    def playlist_meta(self, playlist_id):
+        with self._lock:
+            meta = self._meta.get(playlist_id)
+            return dict(meta) if meta else None
+
+    def playlist_tracks(self, playlist_id):
+        """Return [(position, track), ...] for every indexed track of one playlist."""
+        with self._lock:
+            return [(position, copy.deepcopy(track))
+                    for position, track in sorted(self._entries.get(playlist_id, {}).items())]
+
+    def age(self, playlist_id):
+        # Seconds since the playlist was last fetched or revalidated
+        with self._lock:
+            checked_at = self._checked.get(playlist_id)
+        return time.time() - checked_at if checked_at else None
+
+    def lookup(self, query, playlist_id=None):
+        """Return {playlist_id: [(position, track), ...]} for tracks whose title or artist contains `query`.
+
+        Both sides are compared in normalized form (see normalize.py), so "Beyonce" finds "Beyoncé".
+        """
+        return self.lookup_many([query], playlist_id).get(query, {})
+
+    def lookup_many(self, queries, playlist_id=None):
+        """Like lookup() for several queries at once: {query: {playlist_id: [(position, track), ...]}}.
+
+        All queries are compiled into one matcher, so the vocabulary is walked once however many there are.
+        A track matched by several queries is the same object in each group.
+        """
+        needles = [match_key(query) for query in queries]
+        if len(needles) == 1:
+            find = lambda key: {0} if needles[0] and needles[0] in key else set()
+        else:
+            find = MultiMatcher(needles).find
+        with self._lock:
+            self._sync()
+            hits = [set(self._postings.get(("id", id_key(query)), ())) if id_key(query) else set() for query in queries]
+            if playlist_id is None:
+                vocabulary = self._postings
+            else:
+                # Only the keys of one playlist need to be matched
+                vocabulary = defaultdict(set)
+                platform = self._meta.get(playlist_id, {}).get("platform", "spotify")
+                for position, track in self._entries.get(playlist_id, {}).items():
+                    for posting_key in track_keys(track, platform):
+                        vocabulary[posting_key].add((playlist_id, position))
+            for (kind, key), postings in vocabulary.items():
+                if kind == "id":
+                    continue
+                for number in find(key):
+                    hits[number] |= postings
+            tracks = {}
+            results = {}
+            for query, query_hits in zip(queries, hits):
+                matches = defaultdict(list)
+                for hit in sorted(query_hits):
+                    hit_playlist, position = hit
+                    if playlist_id is not None and hit_playlist != playlist_id:
+                        continue
+                    if hit not in tracks:
+                        tracks[hit] = copy.deepcopy(self._entries[hit_playlist][position])
+                    matches[hit_playlist].append((position, tracks[hit]))
+                results[query] = dict(matches)
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PlaylistIndex()
+        return _index
@@ -0,0 +1,84 @@
+"""
+one-time Playwright browser provisioning, verified by a marker file
+
+Run `python provisioning.py` in the deployment's build step; the app then only checks the marker.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from importlib import metadata
+from pathlib import Path
+
+from storage import CACHE_DIR
+
+MARKER = CACHE_DIR / "playwright-chromium.json"
+
+_lock = threading.Lock()
+
+
+def browsers_path():
+    configured = os.environ.get("PLAYWRIGHT_BROWSERS_PATH")
+    if configured and configured != "0":
+        return Path(configured)
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "ms-playwright"
+    if sys.platform == "win32":
+        return Path(os.environ.get("LOCALAPPDATA", Path.home())) / "ms-playwright"
+    return Path.home() / ".cache" / "ms-playwright"
+
+
+def playwright_version():
+    try:
+        return metadata.version("playwright")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def _chromium_dirs():
+    root = browsers_path()
+    return sorted(str(path) for path in root.glob("chromium*")) if root.is_dir() else []
+
+
+def is_provisioned():
+    # Valid while the same playwright release is installed and its browser directories still exist
+    try:
+        marker = json.loads(MARKER.read_text())
+    except (OSError, ValueError):
+        return False
+    return (marker.get("playwright") == playwright_version()
+            and bool(marker.get("browsers"))
+            and all(Path(path).is_dir() for path in marker["browsers"]))
+
+
+def ensure_browser():
+    """Install Chromium for Playwright unless the marker says it is there. Returns (ok, error message)."""
+    if is_provisioned():
+        return True, None
+    with _lock:
+        if is_provisioned():
+            return True, None
+        if playwright_version() is None:
+            return False, "Playwright ist nicht installiert."
+        command = [shutil.which("playwright") or sys.executable, "install", "chromium"]
+        if not shutil.which("playwright"):
+            command[1:1] = ["-m", "playwright"]
+        try:
+            subprocess.run(command, check=True)
+        except Exception as e:
+            return False, str(e)
+        browsers = _chromium_dirs()
+        if not browsers:
+            return False, f"no Chromium found in {browsers_path()} after install"
+        MARKER.parent.mkdir(parents=True, exist_ok=True)
+        MARKER.write_text(json.dumps({"playwright": playwright_version(), "browsers": browsers}))
+        return True, None
+
+
+if __name__ == "__main__":
+    ok, error = ensure_browser()
+    print("Chromium ready" if ok else f"Provisioning failed: {error}")
+    sys.exit(0 if ok else 1)
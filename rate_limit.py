@@ -0,0 +1,113 @@
+"""
+per-host request scheduling: token buckets, Retry-After and adaptive concurrency
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# host: (sustained requests per second, burst). Spotify only documents a rolling
+# 30 s window, so stay well below what it tolerates; Deezer allows 50 requests
+# per 5 seconds, Notion an average of 3 requests per second.
+RATE_LIMITS = {
+    "api.spotify.com": (10, 20),
+    "api-partner.spotify.com": (8, 16),
+    "accounts.spotify.com": (2, 4),
+    "api.deezer.com": (10, 50),
+    "api.notion.com": (3, 3),
+}
+DEFAULT_RATE_LIMIT = (50, 50)
+
+DEFAULT_RETRY_AFTER = 5  # seconds to back off on a 429 without Retry-After
+MAX_RETRY_AFTER = 120
+LATENCY_FACTOR = 3  # shrink concurrency when latency exceeds this multiple of the endpoint's usual latency
+LATENCY_SMOOTHING = 0.1  # weight of the newest response in the per-endpoint latency average
+POLL_INTERVAL = 0.02
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0), MAX_RETRY_AFTER)
+
+
+class HostScheduler:
+    def __init__(self, rate, burst, max_concurrency):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.baselines = {}  # endpoint class: moving average of its latency
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self):
+        # Returns 0 once a slot and a token are taken, otherwise the time to wait
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.in_flight >= int(self.limit):
+                return POLL_INTERVAL
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+            self.in_flight += 1
+            return 0
+
+    def acquire(self):
+        while wait := self._try_acquire():
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while wait := self._try_acquire():
+            await asyncio.sleep(wait)
+
+    def release(self, latency, rate_limited=False, retry_after=None, endpoint=None):
+        # AIMD: halve the concurrency limit on 429s or latency spikes, grow it back slowly otherwise.
+        # A spike is measured against the same kind of request: a 304 and a 100-track page differ by design.
+        with self._lock:
+            self.in_flight -= 1
+            if rate_limited:
+                self.throttled += 1
+                self.limit = max(1.0, self.limit / 2)
+                delay = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+                return
+            if latency is None:
+                return
+            baseline = self.baselines.get(endpoint, latency)
+            self.baselines[endpoint] = baseline + LATENCY_SMOOTHING * (latency - baseline)
+            if latency > LATENCY_FACTOR * baseline:
+                self.limit = max(1.0, self.limit * 0.9)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+
+_schedulers = {}
+_lock = threading.Lock()
+
+
+def get_scheduler(host, max_concurrency):
+    with _lock:
+        scheduler = _schedulers.get(host)
+        if scheduler is None:
+            rate, burst = RATE_LIMITS.get(host, DEFAULT_RATE_LIMIT)
+            scheduler = HostScheduler(rate, burst, max_concurrency)
+            _schedulers[host] = scheduler
+        return scheduler
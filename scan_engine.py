@@ -0,0 +1,535 @@
+"""
+async scan engine
+"""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+import http_client
+import metrics
+from api_cache import cache_key, get_api_cache
+from formatting import format_number
+from normalize import match_keys
+from placements import get_placement_store
+from playcount_store import get_playcount_store
+from playlist_index import get_index
+from token_manager import get_api_token_manager, get_web_token_manager
+
+# Overridable so the benchmarks (and tests against stand-ins) can point the engine at local servers
+SPOTIFY_API = os.environ.get("SPOTIFY_API_BASE", "https://api.spotify.com")
+SPOTIFY_PARTNER_API = os.environ.get("SPOTIFY_PARTNER_API_BASE", "https://api-partner.spotify.com")
+DEEZER_API = os.environ.get("DEEZER_API_BASE", "https://api.deezer.com")
+
+SCAN_CONCURRENCY = int(os.environ.get("SCAN_CONCURRENCY", "16"))  # max in-flight requests per scan
+REVALIDATE_INTERVAL = 5 * 60  # seconds before the crawler checks an indexed playlist's version marker again
+# Scans leave freshness to the crawler (every 30-60 min) and only revalidate playlists it has not refreshed
+SCAN_REVALIDATE_INTERVAL = int(os.environ.get("SCAN_REVALIDATE_INTERVAL", 2 * 60 * 60))
+
+SPOTIFY_PAGE_SIZE = 100
+TRACKS_BATCH_SIZE = 50
+DEEZER_PAGE_SIZE = 100
+SPOTIFY_PLAYLIST_FIELDS = "name,description,owner(display_name),followers(total),images,snapshot_id"
+PLAYCOUNT_QUERY_HASH = "26cd58ab86ebba80196c41c3d48a4324c619e9a9d7df26ecca22417e0c50c6a4"
+ALBUM_QUERY_HASH = "46ae954ef2d2fe7732b4b2b4022157b2e18b7ea84f70591ceb164e4de1b5d5d3"
+ALBUM_PAGE_SIZE = 50
+
+
+def generate_track_key(track):
+    # Keys are computed once at ingestion; tracks from elsewhere are keyed on the fly
+    keys = track.get("keys") or match_keys(track.get("name", ""), [a.get("name", "") for a in track.get("artists", [])])
+    return f"{keys['name']} - {'/'.join(sorted(keys['artists']))}"
+
+
+# --- Event loop ---
+# One loop thread per process owns the async HTTP clients, so every session shares their connections
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="scan-engine", daemon=True).start()
+        return _loop
+
+
+_album_tasks = {}
+_playlist_tasks = {}
+
+
+class ScanEngine:
+    """`token` is the web-player token for the partner API; `api_token` (client credentials) is used for the
+    public Web API and defaults to `token`. Without a web-player token the scan runs without new playcounts."""
+
+    def __init__(self, token, concurrency=SCAN_CONCURRENCY, api_token=None):
+        self.token = token
+        self.api_token = api_token or token
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.failed = []  # playlist ids whose refresh failed during this scan
+
+    def api_headers(self):
+        return {"Authorization": f"Bearer {self.api_token}"}
+
+    def partner_headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def invalidate(self, token):
+        # A rejected token is dropped from its manager so the next get() refreshes it instead of serving it again
+        if token == self.api_token and token != self.token:
+            manager = get_api_token_manager()
+        else:
+            manager = get_web_token_manager()
+        if manager:
+            manager.invalidate(token)
+
+    async def request(self, url, params=None, headers=None):
+        async with self.semaphore:
+            response = await http_client.async_request("GET", url, params=params, headers=headers)
+        if response.status_code == 401 and headers and headers.get("Authorization", "").startswith("Bearer "):
+            self.invalidate(headers["Authorization"][len("Bearer "):])
+        return response
+
+    async def api_request(self, url, params=None, headers=None):
+        response = await self.request(url, params=params, headers={**self.api_headers(), **(headers or {})})
+        if response.status_code in (401, 403, 404) and self.token and self.api_token != self.token:
+            # Client-credentials tokens cannot read Spotify's own editorial playlists; the web-player token can
+            response = await self.request(url, params=params, headers={**self.partner_headers(), **(headers or {})})
+        return response
+
+    async def get_json(self, url, params=None, headers=None, tier=None, cache_extra=None, api=False):
+        # With a tier the response goes through the persistent API cache; errors raise and are never stored.
+        # api=True sends the request with the Web API token. SQLite calls run in worker threads, so a store
+        # locked by another process never stalls the loop every session shares.
+        if tier:
+            key = cache_key(url, params, cache_extra)
+            cached = await asyncio.to_thread(get_api_cache().get, key, tier)
+            if cached is not None:
+                return cached
+        send = self.api_request if api else self.request
+        data = http_client.json_or_raise(await send(url, params=params, headers=headers))
+        if tier:
+            await asyncio.to_thread(get_api_cache().set, key, data, tier)
+        return data
+
+    async def fetch_all_pages(self, fetch_page, items_key, page_size):
+        # First page tells us the total, the rest is requested in parallel
+        first_page = await fetch_page(0)
+        items = list(first_page.get(items_key, []))
+        total = first_page.get("total") or len(items)
+        pages = await asyncio.gather(*(fetch_page(offset) for offset in range(page_size, total, page_size)))
+        for page in pages:
+            items.extend(page.get(items_key, []))
+        return items
+
+    # --- Playlists ---
+    @metrics.timed("playlist_version")
+    async def get_playlist_version(self, playlist_id, etag=None):
+        # Returns (snapshot_id, etag); snapshot_id is None when the stored ETag is still current
+        headers = {"If-None-Match": etag} if etag else None
+        url = f"{SPOTIFY_API}/v1/playlists/{playlist_id}"
+        response = await self.api_request(url, params={"fields": "snapshot_id"}, headers=headers)
+        if response.status_code == 304:
+            return None, etag
+        return http_client.json_or_raise(response).get("snapshot_id"), response.headers.get("ETag")
+
+    @metrics.timed("playlist_metadata")
+    async def get_playlist_data(self, playlist_id):
+        return await self.get_json(f"{SPOTIFY_API}/v1/playlists/{playlist_id}",
+                                   params={"fields": SPOTIFY_PLAYLIST_FIELDS}, tier="long", api=True)
+
+    @metrics.timed("playlist_metadata")
+    async def get_deezer_playlist_data(self, playlist_id):
+        return await self.get_json(f"{DEEZER_API}/playlist/{playlist_id}")
+
+    @metrics.timed("track_pages")
+    async def get_spotify_playlist_tracks(self, playlist_id, snapshot_id):
+        url = f"{SPOTIFY_API}/v1/playlists/{playlist_id}/tracks"
+
+        async def fetch_page(offset):
+            params = {"limit": SPOTIFY_PAGE_SIZE, "offset": offset}
+            return await self.get_json(url, params=params, tier="medium", cache_extra=snapshot_id, api=True)
+
+        return await self.fetch_all_pages(fetch_page, "items", SPOTIFY_PAGE_SIZE)
+
+    @metrics.timed("track_pages")
+    async def get_deezer_playlist_tracks(self, playlist_id, checksum):
+        url = f"{DEEZER_API}/playlist/{playlist_id}/tracks"
+
+        async def fetch_page(index):
+            return await self.get_json(url, params={"limit": DEEZER_PAGE_SIZE, "index": index},
+                                       tier="medium", cache_extra=checksum)
+
+        return await self.fetch_all_pages(fetch_page, "data", DEEZER_PAGE_SIZE)
+
+    async def index_playlist(self, playlist_id, platform):
+        # Re-download tracks only when the snapshot_id / checksum has moved
+        index = get_index()
+        version = index.playlist_version(playlist_id)
+        known = index.playlist_meta(playlist_id) is not None
+        if platform == "spotify":
+            snapshot_id, etag = await self.get_playlist_version(playlist_id, version.get("etag") if known else None)
+            playlist = await self.get_playlist_data(playlist_id)
+            followers = (playlist.get("followers") or {}).get("total", "N/A")
+            meta = {
+                "name": playlist.get("name", "Unknown Playlist"),
+                "owner": (playlist.get("owner") or {}).get("display_name", "N/A"),
+                "followers": format_number(followers) if isinstance(followers, int) else followers,
+                "description": playlist.get("description", ""),
+                "cover": (playlist.get("images") or [{}])[0].get("url"),
+                "url": f"https://open.spotify.com/playlist/{playlist_id}",
+            }
+            new_version = {"etag": etag, "snapshot_id": snapshot_id} if snapshot_id else version
+            if known and (snapshot_id is None or version.get("snapshot_id") == snapshot_id):
+                # Same snapshot (or a 304): only the cached metadata may have moved
+                await asyncio.to_thread(index.update_meta, playlist_id, meta, new_version)
+                return
+            tracks = [item.get("track") for item in await self.get_spotify_playlist_tracks(playlist_id, snapshot_id)]
+        else:
+            playlist = await self.get_deezer_playlist_data(playlist_id)
+            followers = playlist.get("fans", "N/A")
+            meta = {
+                "name": playlist.get("title", "Unknown Playlist"),
+                "owner": (playlist.get("user") or playlist.get("creator") or {}).get("name", "N/A"),
+                "followers": format_number(followers) if isinstance(followers, int) else followers,
+                "description": playlist.get("description", ""),
+                "cover": playlist.get("picture"),
+                "url": f"https://www.deezer.com/playlist/{playlist_id}",
+            }
+            new_version = {"checksum": playlist.get("checksum")}
+            if known and new_version["checksum"] and version.get("checksum") == new_version["checksum"]:
+                await asyncio.to_thread(index.update_meta, playlist_id, meta, new_version)
+                return
+            # The playlist object already embeds the tracks for short playlists
+            embedded = playlist.get("tracks", {}).get("data", [])
+            if len(embedded) >= playlist.get("nb_tracks", len(embedded) + 1):
+                tracks = embedded
+            else:
+                tracks = await self.get_deezer_playlist_tracks(playlist_id, new_version["checksum"])
+        with metrics.phase("index_write"):
+            await asyncio.to_thread(index.update_playlist, playlist_id, platform, meta, tracks, new_version)
+            # Only changed track lists reach this point, so every stored snapshot is a change point
+            await asyncio.to_thread(
+                get_placement_store().record,
+                playlist_id, [(position, track.get("id")) for position, track in enumerate(tracks, start=1) if track]
+            )
+
+    async def shared_index_playlist(self, playlist_id, platform):
+        # Concurrent scans and the crawler refreshing the same playlist wait on one refresh
+        task = _playlist_tasks.get(playlist_id)
+        if task is None:
+            task = asyncio.ensure_future(self.index_playlist(playlist_id, platform))
+            _playlist_tasks[playlist_id] = task
+            task.add_done_callback(lambda _: _playlist_tasks.pop(playlist_id, None))
+        await asyncio.shield(task)
+
+    # --- Enrichment ---
+    async def get_spotify_playcount(self, track_id):
+        variables = json.dumps({"uri": f"spotify:track:{track_id}"})
+        extensions = json.dumps({"persistedQuery": {"version": 1, "sha256Hash": PLAYCOUNT_QUERY_HASH}})
+        params = {"operationName": "getTrack", "variables": variables, "extensions": extensions}
+        data = await self.get_json(f"{SPOTIFY_PARTNER_API}/pathfinder/v1/query",
+                                   params=params, headers=self.partner_headers())
+        return int(data["data"]["trackUnion"].get("playcount", 0))
+
+    @metrics.timed("track_info")
+    async def get_tracks_info(self, track_ids):
+        # Release date and cover for many tracks, up to TRACKS_BATCH_SIZE IDs per request
+        cache = get_api_cache()
+        keys = {f"spotify:track-info:{track_id}": track_id for track_id in track_ids}
+        info = {keys[key]: value for key, value in (await asyncio.to_thread(cache.get_many, keys, "long")).items()}
+        missing = [track_id for track_id in track_ids if track_id not in info]
+        chunks = [missing[i:i + TRACKS_BATCH_SIZE] for i in range(0, len(missing), TRACKS_BATCH_SIZE)]
+        responses = await asyncio.gather(
+            *(self.get_json(f"{SPOTIFY_API}/v1/tracks", params={"ids": ",".join(chunk)}, api=True)
+              for chunk in chunks),
+            return_exceptions=True,
+        )
+        for response in responses:
+            if isinstance(response, Exception):
+                print(f"Track lookup error: {response}")
+                continue
+            for data in response.get("tracks", []):
+                if not data:
+                    continue
+                images = data.get("album", {}).get("images", [])
+                info[data["id"]] = {
+                    "release_date": data.get("album", {}).get("release_date", "N/A"),
+                    "cover_url": images[0].get("url", "") if images else "",
+                }
+        await asyncio.to_thread(
+            cache.set_many,
+            {f"spotify:track-info:{track_id}": info[track_id] for track_id in missing if track_id in info}, "long"
+        )
+        return info
+
+    async def get_album_playcounts(self, album_id):
+        # One pathfinder getAlbum call returns the playcount of every track on the album
+        playcounts = {}
+        offset = 0
+        while True:
+            variables = json.dumps({"uri": f"spotify:album:{album_id}", "locale": "", "offset": offset,
+                                    "limit": ALBUM_PAGE_SIZE})
+            extensions = json.dumps({"persistedQuery": {"version": 1, "sha256Hash": ALBUM_QUERY_HASH}})
+            params = {"operationName": "getAlbum", "variables": variables, "extensions": extensions}
+            data = await self.get_json(f"{SPOTIFY_PARTNER_API}/pathfinder/v1/query",
+                                       params=params, headers=self.partner_headers())
+            album = data.get("data", {}).get("albumUnion", {})
+            tracks = album.get("tracksV2") or album.get("tracks") or {}
+            items = tracks.get("items", [])
+            for item in items:
+                track = item.get("track", {})
+                if track.get("uri") and track.get("playcount") is not None:
+                    playcounts[track["uri"].split(":")[-1]] = int(track["playcount"])
+            offset += len(items)
+            if not items or offset >= tracks.get("totalCount", 0):
+                return playcounts
+
+    async def shared_album_playcounts(self, album_id):
+        # Concurrent scans asking for the same album wait on one request
+        task = _album_tasks.get(album_id)
+        if task is None:
+            task = asyncio.ensure_future(self.get_album_playcounts(album_id))
+            _album_tasks[album_id] = task
+            task.add_done_callback(lambda _: _album_tasks.pop(album_id, None))
+        try:
+            return await asyncio.shield(task)
+        except (http_client.ApiError, httpx.HTTPError) as e:
+            print(f"Album playcount error for {album_id}: {e}")
+            return {}
+
+    @metrics.timed("playcounts")
+    async def get_playcounts(self, album_ids):
+        """Resolve {track_id: album_id} to {track_id: playcount}, reusing counts from the playcount store."""
+        store = get_playcount_store()
+        playcounts = await asyncio.to_thread(store.get_many, album_ids)
+        missing = [track_id for track_id in album_ids if track_id not in playcounts]
+        if not self.token:
+            return playcounts
+        albums = sorted({album_ids[track_id] for track_id in missing if album_ids[track_id]})
+        fetched = {}
+        for album_playcounts in await asyncio.gather(*(self.shared_album_playcounts(a) for a in albums)):
+            fetched.update(album_playcounts)
+
+        # Tracks without an album ID or missing from the album response fall back to getTrack
+        async def single(track_id):
+            try:
+                return track_id, await self.get_spotify_playcount(track_id)
+            except (http_client.ApiError, httpx.HTTPError, KeyError) as e:
+                print(f"Playcount error for track {track_id}: {e}")
+                return track_id, None
+
+        leftovers = [track_id for track_id in missing if track_id not in fetched]
+        for track_id, playcount in await asyncio.gather(*(single(track_id) for track_id in leftovers)):
+            if playcount is not None:
+                fetched[track_id] = playcount
+        await asyncio.to_thread(store.put_many, fetched)
+        playcounts.update({track_id: fetched[track_id] for track_id in missing if track_id in fetched})
+        return playcounts
+
+    @metrics.timed("enrichment")
+    async def enrich_tracks(self, tracks):
+        """Add streams, release_date and cover_url to Spotify tracks, one lookup per unique track."""
+        by_id = defaultdict(list)
+        for track in tracks:
+            if track.get("id"):
+                by_id[track["id"]].append(track)
+        # Playlist items already carry the album; only ask /v1/tracks for the ones that don't
+        incomplete = [
+            track_id for track_id, same in by_id.items()
+            if not (same[0].get("album", {}).get("release_date") and same[0].get("album", {}).get("images"))
+        ]
+        album_ids = {track_id: same[0].get("album", {}).get("id") for track_id, same in by_id.items()}
+        info, playcounts = await asyncio.gather(self.get_tracks_info(incomplete), self.get_playcounts(album_ids))
+        for track_id, same in by_id.items():
+            album = same[0].get("album", {})
+            images = album.get("images") or []
+            extra = info.get(track_id, {})
+            for track in same:
+                track["streams"] = playcounts.get(track_id)
+                track["release_date"] = extra.get("release_date") or album.get("release_date") or "N/A"
+                track["cover_url"] = extra.get("cover_url") or (images[0].get("url", "") if images else "")
+
+    async def normalize_deezer_track(self, track):
+        normalized = {}
+        normalized["name"] = track.get("title", "Unknown Title")
+        artist_obj = track.get("artist", {})
+        normalized["artists"] = [{
+            "name": artist_obj.get("name", "Unknown Artist"),
+            "id": str(artist_obj.get("id", ""))
+        }]
+        cover_url = track.get("album", {}).get("cover")
+        normalized["album"] = {"images": [{"url": cover_url}]} if cover_url else {"images": []}
+        normalized["cover_url"] = cover_url
+        normalized["streams"] = track.get("rank", 0)
+        normalized["popularity"] = 0
+        normalized["release_date"] = "N/A"
+        normalized["platform"] = "Deezer"
+        normalized["id"] = str(track.get("id"))
+        if track.get("keys"):
+            normalized["keys"] = track["keys"]
+        # Fallback: try to get cover from Spotify if cover_url is empty
+        if not normalized["cover_url"]:
+            try:
+                params = {"q": f"{normalized['name']} {normalized['artists'][0]['name']}", "type": "track", "limit": 1}
+                with metrics.phase("deezer_cover_fallback"):
+                    data = await self.get_json(f"{SPOTIFY_API}/v1/search", params=params, tier="long", api=True)
+                item = data.get("tracks", {}).get("items", [])[0]
+                normalized["cover_url"] = item.get("album", {}).get("images", [{}])[0].get("url", "")
+            except Exception:
+                pass
+        return normalized
+
+    # --- Scan ---
+    async def scan_playlist(self, playlist_id, platform, queries, known_matches):
+        index = get_index()
+        age = index.age(playlist_id)
+        if age is None or age > SCAN_REVALIDATE_INTERVAL:
+            try:
+                await self.shared_index_playlist(playlist_id, platform)
+            except Exception as e:
+                # Keep serving the last good copy of the playlist, if there is one; one bad playlist never
+                # ends the scan
+                print(f"Playlist refresh error for {playlist_id}: {e}")
+                self.failed.append(playlist_id)
+            known_matches = index.lookup_many(queries, playlist_id=playlist_id)
+        playlist = index.playlist_meta(playlist_id)
+        if not playlist:
+            return None
+        by_query = {query: known_matches[query].get(playlist_id, []) for query in queries}
+        # Positions matched by several queries share one track object, so each is prepared once
+        tracks = {position: track for matches in by_query.values() for position, track in matches}
+        if platform != "spotify":
+            positions = list(tracks)
+            normalized = await asyncio.gather(*(self.normalize_deezer_track(tracks[p]) for p in positions))
+            tracks = dict(zip(positions, normalized))
+        return {
+            "platform": platform,
+            "playlist_name": playlist["name"],
+            "playlist_owner": playlist["owner"],
+            "playlist_followers": playlist["followers"],
+            "playlist_description": playlist["description"],
+            "matches": {
+                query: [{"track": tracks[position], "position": position} for position, _ in matches]
+                for query, matches in by_query.items()
+            },
+            "cover": playlist["cover"],
+            "url": playlist["url"],
+        }
+
+    async def scan_iter(self, playlists, queries):
+        """Yield (playlist number, result) pairs in completion order, then enrich all Spotify matches in one batch.
+
+        Every playlist is visited once for all `queries`; result["matches"] holds the matches per query.
+        """
+        started = time.perf_counter()
+        with metrics.phase("index_lookup"):
+            known_matches = get_index().lookup_many(queries)
+
+        async def numbered(number, playlist_id, platform):
+            return number, await self.scan_playlist(playlist_id, platform, queries, known_matches)
+
+        tasks = [asyncio.ensure_future(numbered(number, pid, platform))
+                 for number, (pid, platform) in enumerate(playlists)]
+        spotify_tracks = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                number, result = await next_done
+                if result and result["platform"] == "spotify":
+                    spotify_tracks.extend(match["track"] for matches in result["matches"].values() for match in matches)
+                yield number, result
+            await self.enrich_tracks(spotify_tracks)
+            metrics.observe("scan_phase_seconds", time.perf_counter() - started, phase="scan")
+            metrics.inc("scans_total")
+        finally:
+            for task in tasks:
+                task.cancel()
+            metrics.export_files()
+
+
+def collect_results(playlist_results, query):
+    # Merge per-playlist matches for `query` into {track key: {"track", "playlists"}} in playlist order
+    results = {}
+    total_listings = 0
+    unique_playlists = set()
+    for result in playlist_results:
+        if not result:
+            continue
+        for match in result["matches"].get(query, []):
+            track = match["track"]
+            total_listings += 1
+            unique_playlists.add(result["playlist_name"])
+            key = generate_track_key(track)
+            if key not in results:
+                results[key] = {"track": track, "playlists": []}
+            results[key]["playlists"].append({
+                "name": result["playlist_name"],
+                "cover": result["cover"],
+                "url": result["url"],
+                "position": match["position"],
+                "platform": result["platform"],
+                "followers": result["playlist_followers"],
+                "owner": result["playlist_owner"],
+                "description": result["playlist_description"],
+            })
+    return {"results": results, "total_listings": total_listings, "unique_playlists": list(unique_playlists)}
+
+
+_DONE = object()
+
+
+class ScanStream:
+    """Per-playlist scan results handed from the engine loop to the calling thread as they complete."""
+
+    def __init__(self, playlists, queries, token, concurrency=SCAN_CONCURRENCY, api_token=None):
+        self.total = len(playlists)
+        self._engine = ScanEngine(token, concurrency, api_token)
+        self._queue = queue.Queue()
+        self._future = asyncio.run_coroutine_threadsafe(self._produce(playlists, queries), get_loop())
+
+    @property
+    def failed(self):
+        # Playlists that could not be refreshed; those without a stored copy are missing from the results
+        return list(self._engine.failed)
+
+    async def _produce(self, playlists, queries):
+        try:
+            async for item in self._engine.scan_iter(playlists, queries):
+                self._queue.put(item)
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            self._queue.put(_DONE)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        # Stops every outstanding playlist, page and enrichment request of this scan
+        self._future.cancel()
+
+
+def scan_batch(playlists, queries, token, concurrency=SCAN_CONCURRENCY, api_token=None):
+    """Scan `playlists` [(id, platform), ...] once for all `queries`; returns {query: scan_playlists()-style dict}."""
+    playlist_results = [result for _, result in sorted(ScanStream(playlists, queries, token, concurrency, api_token),
+                                                       key=lambda item: item[0])]
+    return {query: collect_results(playlist_results, query) for query in queries}
+
+
+def scan_playlists(playlists, query, token, concurrency=SCAN_CONCURRENCY, api_token=None):
+    """Scan `playlists` [(id, platform), ...] for `query` and return results, total_listings and unique_playlists."""
+    return scan_batch(playlists, [query], token, concurrency, api_token)[query]
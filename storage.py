@@ -0,0 +1,125 @@
+"""
+local storage helpers
+"""
+
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+CACHE_DIR = Path(os.environ.get("PLAYLIST_SCANNER_CACHE_DIR", ".cache"))
+MAX_PARAMS = 500  # bound parameters per statement, well below SQLite's limit
+TOUCH_INTERVAL = 10 * 60  # accessed_at is only rewritten once it is this stale, so most hits never write
+
+
+def connect(filename):
+    # One SQLite file per store, WAL so readers never block the writer
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(CACHE_DIR / filename, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def select_in(conn, sql, keys, params=()):
+    """All rows of `sql` for `keys`, queried in chunks; "{keys}" in `sql` stands for the chunk's placeholders.
+
+    Keys are plain values or tuples (compared as row values, e.g. "(url_hash, px) IN ({keys})"). `params` are
+    bound before the keys.
+    """
+    keys = list(keys)
+    if not keys:
+        return []
+    width = len(keys[0]) if isinstance(keys[0], tuple) else 0
+    step = MAX_PARAMS // max(width, 1)
+    rows = []
+    for i in range(0, len(keys), step):
+        chunk = keys[i:i + step]
+        if width:
+            placeholders = "VALUES " + ",".join(["(" + ",".join("?" * width) + ")"] * len(chunk))
+            values = [value for key in chunk for value in key]
+        else:
+            placeholders = ",".join("?" * len(chunk))
+            values = chunk
+        rows.extend(conn.execute(sql.format(keys=placeholders), [*params, *values]).fetchall())
+    return rows
+
+
+class LruTable:
+    """Byte-capped table evicted least recently used first, down to 90% of `max_bytes`.
+
+    The table needs `size` and `accessed_at` columns; `key_columns` identify a row. Callers hold their own lock
+    around every call. `expire` runs first on eviction, inside the same transaction.
+    """
+
+    def __init__(self, conn, table, key_columns, max_bytes, expire=None):
+        self._conn = conn
+        self.table = table
+        self.key_columns = list(key_columns)
+        self.max_bytes = max_bytes
+        self._expire = expire
+        self._key_list = ", ".join(self.key_columns)
+        self._key_match = " AND ".join(f"{column} = ?" for column in self.key_columns)
+        self.size = self.stored_bytes()
+
+    def stored_bytes(self):
+        return self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+    def _keys(self, rows, width):
+        # Plain values for a one-column key, tuples otherwise
+        return [row[0] if width == 1 else tuple(row[:width]) for row in rows]
+
+    def get_many(self, columns, keys, where="1", params=(), now=None):
+        """Rows (key columns..., `columns`...) for the `keys` that match `where`; stale accessed_at is refreshed."""
+        now = now if now is not None else time.time()
+        width = len(self.key_columns)
+        rows = select_in(
+            self._conn,
+            f"SELECT {self._key_list}, accessed_at, {columns} FROM {self.table} "
+            f"WHERE {where} AND ({self._key_list}) IN ({{keys}})",
+            keys, params,
+        )
+        stale = [(now, *row[:width]) for row in rows if now - row[width] > TOUCH_INTERVAL]
+        if stale:
+            with self._conn:
+                self._conn.executemany(f"UPDATE {self.table} SET accessed_at = ? WHERE {self._key_match}", stale)
+        return [row[:width] + row[width + 1:] for row in rows]
+
+    def replace(self, columns, rows):
+        """INSERT OR REPLACE `rows` (tuples in `columns` order, including the key columns and size)."""
+        positions = [columns.index(column) for column in self.key_columns]
+        size_at = columns.index("size")
+        keys = self._keys([[row[i] for i in positions] for row in rows], len(positions))
+        # Replaced rows give their bytes back
+        replaced = sum(size for size, in select_in(
+            self._conn, f"SELECT size FROM {self.table} WHERE ({self._key_list}) IN ({{keys}})", keys
+        ))
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} ({', '.join(columns)}) VALUES ({','.join('?' * len(columns))})",
+                rows,
+            )
+        self.size += sum(row[size_at] for row in rows) - replaced
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        width = len(self.key_columns)
+        with self._conn:
+            if self._expire:
+                self._expire()
+            self.size = self.stored_bytes()
+            target = int(self.max_bytes * 0.9)
+            while self.size > target:
+                rows = self._conn.execute(
+                    f"SELECT {self._key_list}, size FROM {self.table} ORDER BY accessed_at LIMIT 200"
+                ).fetchall()
+                if not rows:
+                    break
+                victims = []
+                for row in rows:
+                    if self.size <= target:
+                        break
+                    victims.append(row[:width])
+                    self.size -= row[width]
+                self._conn.executemany(f"DELETE FROM {self.table} WHERE {self._key_match}", victims)
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Stores opened by the modules under test must not land in the working copy's .cache
+os.environ.setdefault("PLAYLIST_SCANNER_CACHE_DIR", tempfile.mkdtemp(prefix="playlist-scanner-tests-"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
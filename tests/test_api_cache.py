@@ -0,0 +1,58 @@
+import os
+
+from api_cache import ApiCache
+
+
+def new_cache(tmp_path, max_bytes=10 ** 9):
+    return ApiCache(str(tmp_path / "api_cache.sqlite"), max_bytes=max_bytes)
+
+
+def payload(n):
+    return os.urandom(n).hex()
+
+
+def test_set_many_replacing_rows_keeps_the_size(tmp_path):
+    cache = new_cache(tmp_path)
+    for _ in range(20):
+        cache.set_many({"a": payload(100), "b": payload(300)}, "long")
+    cache.set("a", "x", "long")
+    assert cache._table.size == cache._table.stored_bytes()
+    assert cache.get("a", "long") == "x"
+    assert cache.stats()["entries"] == 2
+
+
+def test_expired_entries_are_not_served(tmp_path):
+    cache = new_cache(tmp_path)
+    cache.set_many({"old": 1, "new": 2}, "short")
+    cache._conn.execute("UPDATE responses SET stored_at = stored_at - 7 * 24 * 3600 WHERE key = 'old'")
+    assert cache.get("old", "short") is None
+    assert cache.get_many(["old", "new"], "short") == {"new": 2}
+
+
+def test_eviction_drops_least_recently_used_down_to_90_percent(tmp_path):
+    cache = new_cache(tmp_path)
+    keys = [f"k{i}" for i in range(40)]
+    for i, key in enumerate(keys):
+        cache.set(key, payload(500), "long")
+        cache._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (1000 + i, key))
+    cache._table.max_bytes = cache._table.size
+    cache.set("extra", payload(500), "long")
+    assert cache._table.size == cache._table.stored_bytes()
+    assert cache._table.size <= cache._table.max_bytes * 0.9
+    assert cache._table.size > cache._table.max_bytes * 0.8
+    kept = set(cache.get_many(keys + ["extra"], "long"))
+    assert "extra" in kept and keys[-1] in kept
+    assert keys[0] not in kept
+    # Strictly oldest first
+    assert kept == set(keys[len(keys) + 1 - len(kept):]) | {"extra"}
+
+
+def test_expired_entries_are_evicted_first(tmp_path):
+    cache = new_cache(tmp_path)
+    cache.set_many({f"k{i}": payload(500) for i in range(9)}, "long")
+    cache.set("k9", payload(5000), "long")
+    cache._conn.execute("UPDATE responses SET stored_at = stored_at - 7 * 24 * 3600 WHERE key = 'k9'")
+    cache._table.max_bytes = cache._table.size
+    cache.set("extra", payload(10), "long")
+    assert "k9" not in cache.get_many(["k9"], "long")
+    assert cache.stats()["entries"] == 10
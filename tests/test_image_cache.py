@@ -0,0 +1,30 @@
+import os
+
+from image_cache import ImageCache, url_hash
+
+
+def new_cache(tmp_path, max_bytes=10 ** 9):
+    return ImageCache(str(tmp_path / "images.sqlite"), max_bytes=max_bytes)
+
+
+def test_store_replacing_thumbnails_keeps_the_size(tmp_path):
+    cache = new_cache(tmp_path)
+    for i in range(20):
+        cache._store("u", {80: os.urandom(i + 1), 200: os.urandom(3)})
+    cache._store("u", {999: os.urandom(5)})
+    cache._store("u", {80: b"x"})
+    assert cache._table.size == cache._table.stored_bytes() == 1 + 3 + 5
+    assert cache.get("u", 80) == b"x"
+
+
+def test_eviction_drops_least_recently_used_down_to_90_percent(tmp_path):
+    cache = new_cache(tmp_path)
+    urls = [f"https://img/{i}" for i in range(40)]
+    for i, url in enumerate(urls):
+        cache._store(url, {80: os.urandom(100)})
+        cache._conn.execute("UPDATE thumbnails SET accessed_at = ? WHERE url_hash = ?", (1000 + i, url_hash(url)))
+    cache._table.max_bytes = cache._table.size
+    cache._store("https://img/extra", {80: os.urandom(100)})
+    assert cache._table.size == cache._table.stored_bytes() == 36 * 100
+    kept = set(cache.get_many(urls + ["https://img/extra"], 80))
+    assert kept == set(urls[-35:]) | {"https://img/extra"}
@@ -0,0 +1,29 @@
+from normalize import match_keys
+from playlist_index import PlaylistIndex
+
+DEEZER_TRACKS = [
+    {"id": 1, "title": "Song (feat. Tyler, The Creator)", "artist": {"name": "A"}},
+    {"id": 2, "title": "Groove [with Earth, Wind & Fire]", "artist": {"name": "B"}},
+    {"id": 3, "title": "Other Song", "artist": {"name": "C"}},
+]
+
+
+def test_credits_stay_searchable_unsplit():
+    keys = match_keys("Song (feat. Tyler, The Creator)", ["A"])
+    assert keys["name"] == "song"
+    assert keys["title"] == "song feat tyler the creator"
+    assert "tyler the creator" in keys["featured"]
+    assert {"tyler", "the creator"} <= set(keys["featured"])
+
+
+def test_featured_skips_main_artists():
+    assert match_keys("Song (feat. B & A)", ["A"])["featured"] == ["b a", "b"]
+
+
+def test_lookup_finds_titles_with_credits(tmp_path):
+    index = PlaylistIndex(str(tmp_path / "index.sqlite"))
+    index.update_playlist("p1", "deezer", {"name": "P1"}, DEEZER_TRACKS)
+    found = index.lookup_many(["Tyler, The Creator", "Earth, Wind & Fire", "Song (feat. Tyler, The Creator)"])
+    assert [track["id"] for _, track in found["Tyler, The Creator"]["p1"]] == [1]
+    assert [track["id"] for _, track in found["Earth, Wind & Fire"]["p1"]] == [2]
+    assert [track["id"] for _, track in found["Song (feat. Tyler, The Creator)"]["p1"]] == [1]
@@ -0,0 +1,46 @@
+import random
+
+from matcher import MultiMatcher
+from playlist_index import PlaylistIndex
+
+
+def random_text(rng, alphabet, length):
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+def test_matches_naive_substring_search():
+    rng = random.Random(7)
+    for _ in range(300):
+        patterns = [random_text(rng, "ab c", rng.randint(0, 4)) for _ in range(rng.randint(1, 12))]
+        matcher = MultiMatcher(patterns)
+        for _ in range(10):
+            text = random_text(rng, "ab c", rng.randint(0, 30))
+            expected = {number for number, pattern in enumerate(patterns) if pattern and pattern in text}
+            assert matcher.find(text) == expected
+
+
+def test_overlapping_and_nested_patterns():
+    matcher = MultiMatcher(["he", "she", "his", "hers", "e"])
+    assert matcher.find("ushers") == {0, 1, 3, 4}
+    assert matcher.find("") == set()
+
+
+def test_batch_lookup_equals_single_lookups(tmp_path):
+    rng = random.Random(3)
+    words = ["capelli", "beyoncé", "ac/dc", "earth", "wind", "fire", "song", "love"]
+    index = PlaylistIndex(str(tmp_path / "index.sqlite"))
+    for playlist in range(4):
+        tracks = [{"id": f"t{playlist}-{n}", "name": " ".join(rng.sample(words, 2)),
+                   "artists": [{"name": rng.choice(words).title(), "id": "a"}]} for n in range(25)]
+        index.update_playlist(f"p{playlist}", "spotify", {"name": f"P{playlist}"}, tracks)
+    queries = ["Capelli", "Beyonce", "AC/DC", "wind", "earth wind", "t2-7", "nothing", "e"]
+
+    def ids(matches):
+        return {pid: [track["id"] for _, track in hits] for pid, hits in matches.items()}
+
+    batch = index.lookup_many(queries)
+    assert {query: ids(batch[query]) for query in queries} == {query: ids(index.lookup(query)) for query in queries}
+    batch = index.lookup_many(queries, playlist_id="p1")
+    assert {query: ids(batch[query]) for query in queries} == \
+        {query: ids(index.lookup(query, playlist_id="p1")) for query in queries}
+    assert ids(index.lookup("t2-7")) == {"p2": ["t2-7"]}
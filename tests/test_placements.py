@@ -0,0 +1,81 @@
+import asyncio
+import types
+
+import httpx
+
+import http_client
+import placements
+import rate_limit
+import scan_engine
+from placements import PlacementStore, get_placement_store
+
+
+def new_store(tmp_path):
+    store = PlacementStore(str(tmp_path / "placements.sqlite"))
+    # p1: a listed, dropped, re-added; b moves.  p2: b listed, then the playlist is emptied
+    store.record("p1", [(1, "a"), (2, "b")], observed_at=100)
+    store.record("p2", [(1, "b")], observed_at=100)
+    store.record("p1", [(1, "b")], observed_at=200)
+    store.record("p1", [(1, "a"), (2, "b")], observed_at=300)
+    store.record("p2", [], observed_at=400)
+    return store
+
+
+def test_removed_and_readded_track_gets_two_spans(tmp_path):
+    assert new_store(tmp_path).spans("a") == [
+        {"playlist_id": "p1", "added": 100, "removed": 200, "positions": [(100, 1)]},
+        {"playlist_id": "p1", "added": 300, "removed": None, "positions": [(300, 1)]},
+    ]
+
+
+def test_spans_across_playlists(tmp_path):
+    store = new_store(tmp_path)
+    spans = store.spans("b")
+    assert {span["playlist_id"]: (span["added"], span["removed"]) for span in spans} == \
+        {"p1": (100, None), "p2": (100, 400)}
+    assert store.spans("b", "p2") == [{"playlist_id": "p2", "added": 100, "removed": 400, "positions": [(100, 1)]}]
+    assert store.spans("unknown") == []
+
+
+def test_position_history(tmp_path):
+    store = new_store(tmp_path)
+    assert store.position_history("b", "p1") == [(100, 2), (200, 1), (300, 2)]
+    assert store.position_history("a", "p2") == []
+
+
+def test_duplicate_listing_keeps_first_position(tmp_path):
+    store = PlacementStore(str(tmp_path / "placements.sqlite"))
+    store.record("p1", [(1, "a"), (5, "a")], observed_at=100)
+    store.record("p1", [(1, "a"), (5, "a")], observed_at=100)
+    assert store.position_history("a", "p1") == [(100, 1)]
+
+
+def test_only_changed_track_lists_are_recorded(monkeypatch):
+    checksum = {"value": "c1"}
+
+    def handler(request):
+        tracks = [{"id": 7, "title": "Song", "artist": {"id": 1, "name": "X"}, "album": {}}]
+        return httpx.Response(200, json={"title": "DZ", "checksum": checksum["value"], "nb_tracks": 1,
+                                         "tracks": {"data": tracks}})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_client, "get_async_client", lambda host: client)
+    monkeypatch.setattr(rate_limit, "_schedulers", {})
+    clock = {"now": 1000}
+    monkeypatch.setattr(placements, "time", types.SimpleNamespace(time=lambda: clock["now"]))
+    engine = scan_engine.ScanEngine("token")
+
+    def refresh():
+        clock["now"] += 60
+        asyncio.run_coroutine_threadsafe(engine.index_playlist("dz-changes", "deezer"), scan_engine.get_loop()).result()
+
+    refresh()
+    refresh()
+    checksum["value"] = "c2"
+    refresh()
+    store = get_placement_store()
+    snapshots = store._conn.execute(
+        "SELECT COUNT(*) FROM snapshots s JOIN playlist_ids p ON p.id = s.playlist WHERE p.playlist_id = ?",
+        ("dz-changes",),
+    ).fetchone()[0]
+    assert snapshots == 2
@@ -0,0 +1,53 @@
+import random
+
+from http_client import endpoint_class
+from rate_limit import HostScheduler
+
+
+def release(scheduler, latency, endpoint=None):
+    scheduler.in_flight += 1
+    scheduler.release(latency, endpoint=endpoint)
+
+
+def test_mixed_latencies_keep_the_limit():
+    # 30% small responses at 40 ms, 70% large ones at 200 ms on the same endpoint
+    rng = random.Random(1)
+    scheduler = HostScheduler(10, 20, 32)
+    for _ in range(400):
+        release(scheduler, (0.04 if rng.random() < 0.3 else 0.2) * rng.uniform(0.8, 1.3))
+    assert scheduler.limit > 24
+
+
+def test_endpoints_are_measured_separately():
+    scheduler = HostScheduler(10, 20, 32)
+    for _ in range(50):
+        release(scheduler, 0.01, "/v1/playlists/* snapshot_id")
+        release(scheduler, 0.3, "/v1/playlists/*/tracks")
+    assert scheduler.limit == 32
+
+
+def test_latency_spike_shrinks_the_limit():
+    scheduler = HostScheduler(10, 20, 32)
+    for _ in range(20):
+        release(scheduler, 0.05)
+    for _ in range(5):
+        release(scheduler, 1.0)
+    assert scheduler.limit < 32 * 0.9 ** 3
+
+
+def test_rate_limited_halves_and_blocks():
+    scheduler = HostScheduler(10, 20, 32)
+    scheduler.in_flight += 1
+    scheduler.release(0.1, rate_limited=True, retry_after=2)
+    assert scheduler.limit == 16
+    assert scheduler._try_acquire() > 1
+
+
+def test_endpoint_class():
+    assert endpoint_class("https://api.spotify.com/v1/playlists/37i9dQZF1DXcBWIGoYBM5M/tracks?offset=100") == \
+        "/v1/playlists/*/tracks"
+    assert endpoint_class("https://api.spotify.com/v1/playlists/37i9dQZF1DXcBWIGoYBM5M",
+                          {"fields": "snapshot_id"}) == "/v1/playlists/* snapshot_id"
+    assert endpoint_class("https://api.deezer.com/playlist/1234") == "/playlist/*"
+    assert endpoint_class("https://api-partner.spotify.com/pathfinder/v1/query",
+                          {"operationName": "getAlbum"}) == "/pathfinder/v1/query getAlbum"
@@ -0,0 +1,47 @@
+import httpx
+import pytest
+
+import http_client
+import rate_limit
+import scan_engine
+
+
+def handler(request):
+    url = request.url
+    if url.host == "api.spotify.com" and url.path.endswith("/tracks"):
+        offset = int(url.params.get("offset", 0))
+        items = [{"track": {"id": f"t{n}", "name": f"Song {n}" + (" (feat. Capelli)" if n % 7 == 0 else ""),
+                            "artists": [{"name": "Other" if n % 3 else "Capelli", "id": "a"}],
+                            "album": {"id": f"al{n % 5}", "release_date": "2024-01-01", "images": [{"url": "c"}]}}}
+                 for n in range(offset, min(offset + 100, 120))]
+        return httpx.Response(200, json={"items": items, "total": 120})
+    if url.host == "api.spotify.com" and url.path.startswith("/v1/playlists/"):
+        return httpx.Response(200, json={"name": "PL", "followers": {"total": 10}, "owner": {"display_name": "o"},
+                                         "images": None, "snapshot_id": "s1"})
+    if url.host == "api-partner.spotify.com":
+        return httpx.Response(200, json={"data": {"albumUnion": {"tracksV2": {"totalCount": 0, "items": []}},
+                                                  "trackUnion": {"playcount": "1000"}}})
+    if url.host == "api.deezer.com":
+        tracks = [{"id": 1, "title": "Other Song", "artist": {"id": 1, "name": "Capelli"}, "album": {"cover": "dc"}},
+                  {"id": 2, "title": "Song 3", "artist": {"id": 2, "name": "Y"}, "album": {"cover": "dc"}}]
+        return httpx.Response(200, json={"title": "DZ", "fans": 5, "checksum": "c1", "nb_tracks": 2,
+                                         "tracks": {"data": tracks}})
+    return httpx.Response(404)
+
+
+@pytest.fixture
+def stub_apis(monkeypatch):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_client, "get_async_client", lambda host: client)
+    monkeypatch.setattr(rate_limit, "RATE_LIMITS", {})
+    monkeypatch.setattr(rate_limit, "_schedulers", {})
+
+
+def test_batch_scan_equals_single_scans(stub_apis):
+    playlists = [("sp1", "spotify"), ("sp2", "spotify"), ("dz1", "deezer")]
+    queries = ["Capelli", "song 3", "nobody"]
+    batch = scan_engine.scan_batch(playlists, queries, "token")
+    for query in queries:
+        assert batch[query] == scan_engine.scan_playlists(playlists, query, "token")
+    assert batch["Capelli"]["total_listings"] > 0
+    assert batch["nobody"]["total_listings"] == 0
@@ -0,0 +1,27 @@
+import sqlite3
+import time
+
+from storage import TOUCH_INTERVAL, LruTable, select_in
+
+
+def test_select_in_chunks_plain_and_row_value_keys():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (a INTEGER, b INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [(n, n % 3) for n in range(1200)])
+    rows = select_in(conn, "SELECT a FROM t WHERE b = ? AND a IN ({keys})", range(1100), params=[1])
+    assert sorted(a for a, in rows) == [n for n in range(1100) if n % 3 == 1]
+    rows = select_in(conn, "SELECT a FROM t WHERE (a, b) IN ({keys})", [(n, n % 3) for n in range(700)] + [(1, 0)])
+    assert len(rows) == 700
+    assert select_in(conn, "SELECT a FROM t WHERE a IN ({keys})", []) == []
+
+
+def test_hits_only_write_once_accessed_at_is_stale():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (key TEXT PRIMARY KEY, value TEXT, size INTEGER, accessed_at REAL)")
+    table = LruTable(conn, "t", ["key"], 10 ** 6)
+    now = time.time()
+    table.replace(["key", "value", "size", "accessed_at"],
+                  [("fresh", "x", 1, now - 60), ("old", "y", 1, now - 2 * TOUCH_INTERVAL)])
+    assert sorted(table.get_many("value", ["fresh", "old", "missing"], now=now)) == [("fresh", "x"), ("old", "y")]
+    accessed = dict(conn.execute("SELECT key, accessed_at FROM t"))
+    assert accessed == {"fresh": now - 60, "old": now}
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import time
+
+import token_manager
+from token_manager import TokenManager
+
+
+class StubFetch:
+    def __init__(self, delay=0.0, fail=False):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            number = self.calls
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("token endpoint down")
+        return f"token-{number}", time.time() + 3600
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_concurrent_gets_share_one_fetch(tmp_path):
+    fetch = StubFetch(delay=0.2)
+    manager = TokenManager(fetch, path=tmp_path / "token.json")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fetch.calls == 1
+    assert results == ["token-1"] * 8
+
+
+def test_non_blocking_get_refreshes_in_the_background(tmp_path):
+    fetch = StubFetch(delay=0.1)
+    manager = TokenManager(fetch, path=tmp_path / "token.json")
+    assert manager.get(block=False) is None
+    assert wait_for(lambda: manager.get(block=False) == "token-1")
+    assert fetch.calls == 1
+
+
+def test_token_close_to_expiry_is_served_while_it_refreshes(tmp_path):
+    fetch = StubFetch(delay=0.1)
+    manager = TokenManager(fetch, path=tmp_path / "token.json", refresh_margin=300)
+    manager.token, manager.expires_at = "old", time.time() + 60
+    assert manager.get() == "old"
+    assert wait_for(lambda: manager.get() == "token-1")
+
+
+def test_invalidate_forces_a_refresh(tmp_path):
+    fetch = StubFetch()
+    manager = TokenManager(fetch, path=tmp_path / "token.json")
+    assert manager.get() == "token-1"
+    manager.invalidate("some other token")
+    assert manager.get() == "token-1"
+    manager.invalidate("token-1")
+    assert manager.get() == "token-2"
+    assert fetch.calls == 2
+
+
+def test_failed_refresh_is_not_retried_right_away(tmp_path, monkeypatch):
+    fetch = StubFetch(fail=True)
+    manager = TokenManager(fetch, path=tmp_path / "token.json")
+    assert manager.get() is None
+    assert manager.get() is None
+    assert fetch.calls == 1
+    assert isinstance(manager.last_error, RuntimeError)
+    monkeypatch.setattr(token_manager, "RETRY_AFTER_FAILURE", 0)
+    fetch.fail = False
+    assert manager.get() == "token-2"
+
+
+def test_token_written_by_another_process_is_picked_up(tmp_path):
+    path = tmp_path / "token.json"
+    fetch = StubFetch()
+    manager = TokenManager(fetch, path=path)
+    assert manager.get() == "token-1"
+    # Another process refreshed and saved a longer-lived token
+    path.write_text(json.dumps({"access_token": "from-crawler", "expires_at": time.time() + 7200}))
+    os.utime(path, (time.time() + 5, time.time() + 5))
+    assert manager.get() == "from-crawler"
+    assert TokenManager(StubFetch(), path=path).get() == "from-crawler"
+    assert fetch.calls == 1
+
+
+def test_legacy_plain_text_token_file(tmp_path):
+    path = tmp_path / "token.txt"
+    path.write_text("plain-token\n")
+    fetch = StubFetch()
+    assert TokenManager(fetch, path=path).get() == "plain-token"
+    assert fetch.calls == 0
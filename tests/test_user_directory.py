@@ -0,0 +1,49 @@
+import time
+
+import user_directory
+from user_directory import UserDirectory
+
+
+def page(page_id, email, password_hash, edited="2025-01-01T00:00:00.000Z"):
+    return {"id": page_id, "last_edited_time": edited, "properties": {
+        "Email": {"title": [{"plain_text": email}]},
+        "Password": {"rich_text": [{"text": {"content": password_hash}}]},
+    }}
+
+
+def new_directory(tmp_path):
+    return UserDirectory("token", "db", "2022-06-28", filename=str(tmp_path / "users.sqlite"))
+
+
+def wait_for_sync(directory):
+    with directory._sync_lock:
+        pass
+
+
+def test_failed_sync_backs_off(tmp_path, monkeypatch):
+    directory = new_directory(tmp_path)
+    calls = []
+
+    def down(payload):
+        calls.append(payload)
+        raise user_directory.http_client.ApiError("503 from notion")
+
+    monkeypatch.setattr(directory, "_query", down)
+    for _ in range(20):
+        directory.maybe_sync()
+        time.sleep(0.005)
+    wait_for_sync(directory)
+    assert len(calls) == 1
+    assert directory._next_attempt >= time.time() + user_directory.SYNC_INTERVAL
+
+
+def test_full_sync_drops_deleted_users(tmp_path, monkeypatch):
+    directory = new_directory(tmp_path)
+    pages = [page("p1", "a@x.de", "h1"), page("p2", "b@x.de", "h2")]
+    monkeypatch.setattr(directory, "_query", lambda payload: {"results": pages, "has_more": False})
+    assert directory.sync(full=True) == 2
+    assert directory.password_hash("b@x.de") == "h2"
+    pages.pop()
+    directory.sync(full=True)
+    assert directory.password_hash("b@x.de") is None
+    assert directory.check_login("a@x.de", "h1")
@@ -0,0 +1,117 @@
+"""
+web-player token harvesting with a headless browser
+
+The browser's storage state is kept in the cache dir, images/fonts/media/stylesheets are never
+loaded, and the harvest returns with the first bearer token the page sends. With
+TOKEN_HARVESTER_KEEP_WARM (default on) Chromium stays open between refreshes.
+"""
+
+import asyncio
+import os
+import time
+
+from provisioning import ensure_browser
+from scan_engine import get_loop
+from storage import CACHE_DIR
+
+WEB_TOKEN_LIFETIME = 60 * 60  # web-player tokens are valid for an hour
+HARVEST_TIMEOUT = float(os.environ.get("TOKEN_HARVEST_TIMEOUT", "20"))
+KEEP_WARM = os.environ.get("TOKEN_HARVESTER_KEEP_WARM", "1") != "0"
+STORAGE_STATE = CACHE_DIR / "spotify-storage-state.json"
+BLOCKED_RESOURCES = {"image", "font", "media", "stylesheet"}
+SPOTIFY_URL = "https://open.spotify.com/"
+
+
+class HarvestError(Exception):
+    pass
+
+
+async def _block_resources(route):
+    if route.request.resource_type in BLOCKED_RESOURCES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class Harvester:
+    """One Chromium context reused across harvests; every method runs on the scan engine loop."""
+
+    def __init__(self, keep_warm=KEEP_WARM):
+        self.keep_warm = keep_warm
+        self._playwright = None
+        self._browser = None
+        self._context = None
+
+    async def _ensure_context(self):
+        if self._context is not None:
+            return self._context
+        from playwright.async_api import async_playwright
+
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        state = str(STORAGE_STATE) if STORAGE_STATE.exists() else None
+        self._context = await self._browser.new_context(storage_state=state)
+        await self._context.route("**/*", _block_resources)
+        return self._context
+
+    async def close(self):
+        try:
+            if self._browser is not None:
+                await self._browser.close()
+            if self._playwright is not None:
+                await self._playwright.stop()
+        except Exception as e:
+            print(f"Harvester close error: {e}")
+        self._playwright = self._browser = self._context = None
+
+    async def _harvest(self):
+        context = await self._ensure_context()
+        page = await context.new_page()
+        token = asyncio.get_running_loop().create_future()
+
+        def handle_request(request):
+            auth = request.headers.get("authorization")
+            if auth and auth.startswith("Bearer ") and not token.done():
+                token.set_result(auth.split(" ")[1])
+
+        page.on("request", handle_request)
+        navigation = asyncio.ensure_future(page.goto(SPOTIFY_URL, wait_until="commit"))
+        try:
+            return await token
+        finally:
+            navigation.cancel()
+            await page.close()
+
+    async def harvest(self, timeout=HARVEST_TIMEOUT):
+        try:
+            result = await asyncio.wait_for(self._harvest(), timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise HarvestError(f"Kein Token innerhalb von {timeout:.0f}s gefunden.")
+        except Exception:
+            await self.close()
+            raise
+        try:
+            STORAGE_STATE.parent.mkdir(parents=True, exist_ok=True)
+            await self._context.storage_state(path=str(STORAGE_STATE))
+        except Exception as e:
+            print(f"Storage state save error: {e}")
+        if not self.keep_warm:
+            await self.close()
+        return result
+
+
+_harvester = Harvester()
+
+
+def fetch_web_token(timeout=HARVEST_TIMEOUT):
+    """Harvest a fresh web-player token; returns (token, expires_at)."""
+    # Only the token harvester needs a browser, so Playwright is provisioned (outside the deadline) and imported here
+    ok, error = ensure_browser()
+    if not ok:
+        raise HarvestError(f"Fehler bei playwright install: {error}")
+    started = time.time()
+    future = asyncio.run_coroutine_threadsafe(_harvester.harvest(timeout), get_loop())
+    # A little slack over the harvest deadline for browser shutdown after a timeout
+    token = future.result(timeout + 10)
+    return token, started + WEB_TOKEN_LIFETIME
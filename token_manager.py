@@ -0,0 +1,172 @@
+"""
+process-wide Spotify token lifecycle: expiry tracking, proactive and single-flight refresh
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import http_client
+from storage import CACHE_DIR
+
+TOKEN_FILE = "token.txt"
+API_TOKEN_FILE = CACHE_DIR / "api_token.json"
+ACCOUNTS_API = os.environ.get("SPOTIFY_ACCOUNTS_BASE", "https://accounts.spotify.com")
+REFRESH_MARGIN = 5 * 60  # refresh in the background once a token is this close to expiry
+REFRESH_TIMEOUT = 90  # seconds a caller waits for someone else's refresh
+RETRY_AFTER_FAILURE = 30  # seconds before a failed refresh is tried again
+LEGACY_TOKEN_LIFETIME = 60 * 60  # plain-text token files carry no expiry, count from their mtime
+
+
+class TokenManager:
+    """Serves a token from memory until shortly before it expires; at most one refresh runs at a time.
+
+    `fetch` returns (token, expires_at). The token is persisted to `path` so other processes
+    (crawler, CLI) and restarts reuse it instead of fetching their own.
+    """
+
+    def __init__(self, fetch, path=TOKEN_FILE, refresh_margin=REFRESH_MARGIN):
+        self._fetch = fetch
+        self._path = Path(path)
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._refreshing = False
+        self._file_mtime = None
+        self.token = None
+        self.expires_at = 0.0
+        self.last_error = None
+        self._failed_at = 0.0
+        self._reload()
+
+    def _reload(self):
+        # Pick up a token another process wrote since we last looked
+        try:
+            mtime = self._path.stat().st_mtime
+        except OSError:
+            return
+        if mtime == self._file_mtime:
+            return
+        self._file_mtime = mtime
+        text = self._path.read_text().strip()
+        try:
+            stored = json.loads(text)
+            token, expires_at = stored["access_token"], float(stored["expires_at"])
+        except (ValueError, KeyError, TypeError):
+            token, expires_at = text, mtime + LEGACY_TOKEN_LIFETIME
+        if token and expires_at > self.expires_at:
+            self.token, self.expires_at = token, expires_at
+
+    def _save(self):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_name(self._path.name + ".tmp")
+        tmp.write_text(json.dumps({"access_token": self.token, "expires_at": self.expires_at}))
+        os.replace(tmp, self._path)
+        self._file_mtime = self._path.stat().st_mtime
+
+    def _refresh(self):
+        try:
+            token, expires_at = self._fetch()
+            error = None
+        except Exception as e:
+            token, error = None, e
+            print(f"Token refresh error: {e}")
+        with self._lock:
+            if token:
+                self.token, self.expires_at = token, expires_at
+                try:
+                    self._save()
+                except OSError as e:
+                    print(f"Token save error: {e}")
+            self.last_error = error
+            self._failed_at = time.time() if error else 0.0
+            self._refreshing = False
+            self._done.notify_all()
+
+    def _start_background_refresh(self):
+        if not self._refreshing and time.time() - self._failed_at >= RETRY_AFTER_FAILURE:
+            self._refreshing = True
+            threading.Thread(target=self._refresh, name="token-refresh", daemon=True).start()
+
+    def get(self, block=True):
+        """Return a valid token, or None when it could not be refreshed.
+
+        With block=False an expired token is refreshed in the background and None is returned right away.
+        """
+        with self._lock:
+            self._reload()
+            now = time.time()
+            if self.token and now < self.expires_at - self.refresh_margin:
+                return self.token
+            if self.token and now < self.expires_at:
+                # Still valid: hand it out and refresh behind the caller's back
+                self._start_background_refresh()
+                return self.token
+            if not block:
+                self._start_background_refresh()
+                return None
+            if not self._refreshing and now - self._failed_at < RETRY_AFTER_FAILURE:
+                # Refreshing failed moments ago; don't hammer the token endpoint (or launch a browser) per rerun
+                return None
+            if self._refreshing:
+                self._done.wait_for(lambda: not self._refreshing, timeout=REFRESH_TIMEOUT)
+                return self.token if self.token and time.time() < self.expires_at else None
+            self._refreshing = True
+        self._refresh()
+        with self._lock:
+            return self.token if self.token and time.time() < self.expires_at else None
+
+    def invalidate(self, token=None):
+        # Call after a 401 so the next get() refreshes instead of serving the rejected token
+        with self._lock:
+            if token is None or token == self.token:
+                self.expires_at = 0.0
+                self._failed_at = 0.0
+
+    def seconds_left(self):
+        with self._lock:
+            return max(0.0, self.expires_at - time.time()) if self.token else 0.0
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def fetch_client_credentials_token(client_id, client_secret):
+    """OAuth client-credentials token for the public Web API; returns (token, expires_at)."""
+    started = time.time()
+    credentials = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+    response = http_client.post(f"{ACCOUNTS_API}/api/token", data={"grant_type": "client_credentials"},
+                                headers={"Authorization": f"Basic {credentials}"})
+    data = http_client.json_or_raise(response)
+    return data["access_token"], started + int(data.get("expires_in", 3600))
+
+
+def get_api_token_manager(client_id=None, client_secret=None):
+    """Manager for the Web API client-credentials token, or None without credentials.
+
+    Credentials default to SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET; the first caller that has them sets them
+    for the process.
+    """
+    client_id = client_id or os.environ.get("SPOTIFY_CLIENT_ID")
+    client_secret = client_secret or os.environ.get("SPOTIFY_CLIENT_SECRET")
+    with _managers_lock:
+        if "api" not in _managers:
+            if not (client_id and client_secret):
+                return None
+            _managers["api"] = TokenManager(lambda: fetch_client_credentials_token(client_id, client_secret),
+                                            path=API_TOKEN_FILE)
+        return _managers["api"]
+
+
+def get_web_token_manager():
+    """Manager for the web-player token harvested with Playwright."""
+    from token_harvester import fetch_web_token
+
+    with _managers_lock:
+        if "web" not in _managers:
+            _managers["web"] = TokenManager(fetch_web_token)
+        return _managers["web"]
@@ -0,0 +1,191 @@
+"""
+local mirror of the Notion user database for logins
+
+Logins are checked against SQLite; the mirror follows Notion incrementally by last_edited_time
+(USER_SYNC_INTERVAL) and is rebuilt in full every USER_FULL_SYNC_INTERVAL so deleted users drop out.
+An unknown email or a changed password falls back to a direct Notion query.
+"""
+
+import json
+import os
+import threading
+import time
+
+import http_client
+from storage import connect
+
+USERS_DB = "users.sqlite"
+NOTION_API = "https://api.notion.com/v1"
+NOTION_PAGE_SIZE = 100
+SYNC_INTERVAL = int(os.environ.get("USER_SYNC_INTERVAL", 60))
+FULL_SYNC_INTERVAL = int(os.environ.get("USER_FULL_SYNC_INTERVAL", 60 * 60))
+MAX_SYNC_BACKOFF = 30 * 60  # longest wait after repeated failed syncs
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    page_id TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    last_edited_time TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_page ON users (page_id);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _text(items):
+    return "".join(item.get("plain_text") or item.get("text", {}).get("content", "") for item in items)
+
+
+def user_record(page):
+    """(email, page_id, password_hash, last_edited_time) of a Notion user page."""
+    properties = page.get("properties", {})
+    rich_text = properties.get("Password", {}).get("rich_text", [])
+    password_hash = rich_text[0].get("text", {}).get("content", "") if rich_text else ""
+    return (_text(properties.get("Email", {}).get("title", [])).strip(), page["id"], password_hash,
+            page.get("last_edited_time", ""))
+
+
+class UserDirectory:
+    def __init__(self, notion_token, database_id, notion_version, filename=USERS_DB):
+        self._url = f"{NOTION_API}/databases/{database_id}/query"
+        self._headers = {
+            "Authorization": f"Bearer {notion_token}",
+            "Notion-Version": notion_version,
+            "Content-Type": "application/json",
+        }
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._next_attempt = 0.0
+        self._failures = 0
+        self._conn = connect(filename)
+        self._conn.executescript(SCHEMA)
+
+    def _query(self, payload):
+        return http_client.json_or_raise(http_client.post(self._url, headers=self._headers, data=json.dumps(payload)))
+
+    def _state(self, name, default=None):
+        row = self._conn.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def _store(self, pages):
+        records = [user_record(page) for page in pages if not page.get("archived") and not page.get("in_trash")]
+        records = [record for record in records if record[0]]
+        with self._lock:
+            with self._conn:
+                # An edited email moves the page to its new key
+                self._conn.executemany("DELETE FROM users WHERE page_id = ? AND email != ?",
+                                       [(page_id, email) for email, page_id, _, _ in records])
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO users (email, page_id, password_hash, last_edited_time) VALUES (?, ?, ?, ?)",
+                    records,
+                )
+
+    def sync(self, full=False):
+        """Pull pages edited since the last sync (all pages with full=True); returns the number of pages seen."""
+        started = int(time.time())
+        with self._lock:
+            cursor = None if full else self._state("last_edited_time")
+        payload = {"page_size": NOTION_PAGE_SIZE,
+                   "sorts": [{"timestamp": "last_edited_time", "direction": "ascending"}]}
+        if cursor:
+            # Notion rounds last_edited_time to the minute, so the boundary minute is fetched again
+            payload["filter"] = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": cursor}}
+        seen = set()
+        latest = cursor
+        while True:
+            data = self._query(payload)
+            pages = data.get("results", [])
+            self._store(pages)
+            seen.update(page["id"] for page in pages)
+            latest = max([latest or ""] + [page.get("last_edited_time", "") for page in pages]) or None
+            if not data.get("has_more"):
+                break
+            payload["start_cursor"] = data["next_cursor"]
+        with self._lock:
+            with self._conn:
+                if full:
+                    # Pages missing from a full pass were deleted or archived in Notion
+                    gone = [(page_id,) for page_id, in self._conn.execute("SELECT DISTINCT page_id FROM users")
+                            if page_id not in seen]
+                    self._conn.executemany("DELETE FROM users WHERE page_id = ?", gone)
+                    self._conn.execute("INSERT OR REPLACE INTO sync_state VALUES ('last_full_sync', ?)", (str(started),))
+                if latest:
+                    self._conn.execute("INSERT OR REPLACE INTO sync_state VALUES ('last_edited_time', ?)", (latest,))
+                self._conn.execute("INSERT OR REPLACE INTO sync_state VALUES ('last_sync', ?)", (str(started),))
+        return len(seen)
+
+    def maybe_sync(self):
+        """Start a background sync when the mirror is older than SYNC_INTERVAL; never blocks the caller.
+
+        Failed syncs are retried after SYNC_INTERVAL, doubling up to MAX_SYNC_BACKOFF.
+        """
+        now = time.time()
+        if now < self._next_attempt:
+            return
+        with self._lock:
+            last_sync = float(self._state("last_sync", 0))
+            last_full_sync = float(self._state("last_full_sync", 0))
+        if now - last_sync < SYNC_INTERVAL and now - last_full_sync < FULL_SYNC_INTERVAL:
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        # Recorded before the attempt, so reruns during a slow or failing sync don't start another one
+        self._next_attempt = now + SYNC_INTERVAL
+
+        def run():
+            try:
+                self.sync(full=now - last_full_sync >= FULL_SYNC_INTERVAL)
+                self._failures = 0
+            except Exception as e:
+                self._failures += 1
+                self._next_attempt = time.time() + min(SYNC_INTERVAL * 2 ** self._failures, MAX_SYNC_BACKOFF)
+                print(f"User sync error: {e}")
+            finally:
+                self._sync_lock.release()
+
+        threading.Thread(target=run, name="user-sync", daemon=True).start()
+
+    def password_hash(self, email):
+        with self._lock:
+            row = self._conn.execute("SELECT password_hash FROM users WHERE email = ?", (email,)).fetchone()
+        return row[0] if row else None
+
+    def fetch_user(self, email):
+        """Query Notion for one email, store the result in the mirror and return the page (or None)."""
+        data = self._query({"filter": {"property": "Email", "title": {"equals": email}}})
+        results = data.get("results", [])
+        if results:
+            self._store(results[:1])
+        else:
+            with self._lock:
+                with self._conn:
+                    self._conn.execute("DELETE FROM users WHERE email = ?", (email,))
+        return results[0] if results else None
+
+    def check_login(self, email, password_hash):
+        self.maybe_sync()
+        if self.password_hash(email) == password_hash:
+            return True
+        # Unknown locally or the password changed since the last sync
+        try:
+            page = self.fetch_user(email)
+        except Exception as e:
+            print(f"Notion login lookup error: {e}")
+            return False
+        return bool(page) and user_record(page)[2] == password_hash
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_user_directory(notion_token, database_id, notion_version):
+    global _directory
+    with _directory_lock:
+        if _directory is None:
+            _directory = UserDirectory(notion_token, database_id, notion_version)
+        return _directory